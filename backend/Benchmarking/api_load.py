@@ -0,0 +1,77 @@
+"""Concurrent load against a running Qaza API.
+
+Start the API (uvicorn backend.main:app) and run from the repo root:
+    python -m backend.Benchmarking.api_load --url http://127.0.0.1:8000 --user <test user id>
+
+Mixes dashboard reads with /qaza/log/ada writes for one test user, so point it
+at a test account. Run it before and after a change and compare throughput:
+with blocking database calls inside async routes, requests serialize on the
+event loop and throughput stays flat as --concurrency grows.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+
+def endpoints(user_id):
+    return [
+        ("GET", f"/qaza/total/{user_id}", None),
+        ("GET", f"/qaza/stats/{user_id}", None),
+        ("POST", "/qaza/log/ada", {"user_id": user_id, "prayers": [{"prayer": "fajr", "status": "completed"}]}),
+    ]
+
+
+async def worker(session, base_url, user_id, deadline, latencies, errors):
+    requests = endpoints(user_id)
+    i = 0
+    while time.monotonic() < deadline:
+        method, path, body = requests[i % len(requests)]
+        i += 1
+        start = time.monotonic()
+        try:
+            async with session.request(method, base_url + path, json=body) as response:
+                await response.read()
+                if response.status >= 400:
+                    errors.append(response.status)
+                    continue
+        except aiohttp.ClientError as e:
+            errors.append(repr(e))
+            continue
+        latencies.append(time.monotonic() - start)
+
+
+async def run(base_url, user_id, concurrency, seconds):
+    latencies, errors = [], []
+    deadline = time.monotonic() + seconds
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[
+            worker(session, base_url, user_id, deadline, latencies, errors)
+            for _ in range(concurrency)
+        ])
+
+    print(f"\n⚙️  Concurrency {concurrency}, {seconds} s")
+    print(f"✅ {len(latencies)} requests, {len(latencies) / seconds:.1f} req/s, {len(errors)} errors")
+    if latencies:
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"⏱ median {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--user", type=int, required=True)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--seconds", type=int, default=10)
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        asyncio.run(run(args.url.rstrip("/"), args.user, concurrency, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Stand-in for the Telegram Bot API on localhost, shared by the benchmarks.
+
+Point the bot at it with TELEGRAM_API_URL. Every method succeeds the way it
+would for a private chat, and what the bot sent is recorded. Raw update JSON
+appended to `updates` is handed out by the next getUpdates.
+"""
+import asyncio
+import itertools
+import time
+
+from aiohttp import web
+
+PORT = 8091
+TOKEN = "123456:fake-token"
+
+answered = {}  # callback_query_id -> time answerCallbackQuery arrived
+sent = []      # (method, chat_id, text or caption) of every sendMessage / sendAnimation
+updates = []   # raw updates waiting for getUpdates
+_message_ids = itertools.count(1)
+
+
+async def fake_bot_api(request: web.Request):
+    method = request.match_info["method"].lower()
+    data = dict(await request.post()) if request.can_read_body else {}
+    if method == "answercallbackquery":
+        answered[data.get("callback_query_id")] = time.monotonic()
+    if method == "getupdates":
+        if not updates:
+            # Nothing to deliver; hold the poll for a moment like long polling does
+            await asyncio.sleep(1)
+        result, updates[:] = list(updates), []
+    elif method in ("sendmessage", "sendanimation"):
+        chat_id = int(data.get("chat_id", 1))
+        sent.append((method, chat_id, data.get("text") or data.get("caption")))
+        result = {"message_id": next(_message_ids), "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}}
+    else:
+        result = True
+    return web.json_response({"ok": True, "result": result})
+
+
+async def start(port: int = PORT) -> web.AppRunner:
+    """Serve the fake Bot API until the returned runner is cleaned up"""
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", fake_bot_api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
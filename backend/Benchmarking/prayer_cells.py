@@ -0,0 +1,89 @@
+"""Per-user vs per-cell prayer time computation on a synthetic population.
+
+Run from the repo root:
+    python -m backend.Benchmarking.prayer_cells
+"""
+import random
+import time
+
+import numpy as np
+from timezonefinder import TimezoneFinder
+
+from backend.Telegram_handler.prayer_calc import (
+    TIMINGS,
+    calc_prayer_times_batch,
+    calc_prayer_times_by_cell,
+)
+
+USERS = 100_000
+
+# Where our users actually live, most of them in a handful of cities
+CITIES = [
+    (41.2995, 69.2401, 40),   # Tashkent
+    (39.6542, 66.9597, 10),   # Samarkand
+    (40.7821, 72.3442, 8),    # Andijan
+    (40.3864, 71.7864, 8),    # Fergana
+    (40.5283, 72.7985, 6),    # Osh
+    (42.8746, 74.5698, 5),    # Bishkek
+    (37.5665, 126.9780, 8),   # Seoul
+    (35.1796, 129.0756, 3),   # Busan
+    (55.7558, 37.6173, 6),    # Moscow
+    (41.0082, 28.9784, 4),    # Istanbul
+    (40.7128, -74.0060, 2),   # New York
+]
+CITY_RADIUS = 0.15  # degrees of jitter around the city center, ~15 km
+
+
+def synthetic_users(n):
+    random.seed(0)
+    weights = [w for _, _, w in CITIES]
+    users = []
+    for user_id in range(n):
+        lat, lon, _ = random.choices(CITIES, weights)[0]
+        users.append({
+            "id": user_id,
+            "lat": round(lat + random.uniform(-CITY_RADIUS, CITY_RADIUS), 4),
+            "lon": round(lon + random.uniform(-CITY_RADIUS, CITY_RADIUS), 4),
+        })
+    return users
+
+
+def main():
+    tf = TimezoneFinder()
+    timezone_of = lambda lat, lon: tf.timezone_at(lat=lat, lng=lon)
+    users = synthetic_users(USERS)
+
+    # Stored with the prayer times at registration
+    for u in users:
+        u["timezone"] = timezone_of(u["lat"], u["lon"])
+    timezones = [u["timezone"] for u in users]
+
+    print(f"👥 {len(users)} synthetic users in {len(CITIES)} cities")
+
+    start = time.time()
+    per_user = calc_prayer_times_batch(
+        [u["lat"] for u in users], [u["lon"] for u in users], timezones
+    )
+    per_user_time = time.time() - start
+
+    start = time.time()
+    per_cell, _, cells = calc_prayer_times_by_cell(users, timezone_of)
+    per_cell_time = time.time() - start
+
+    def minutes(t):
+        return int(t[:2]) * 60 + int(t[3:]) if t else -1
+
+    diffs = np.array([
+        abs(minutes(per_user[i][name]) - minutes(per_cell[u["id"]][name]))
+        for i, u in enumerate(users)
+        for name in TIMINGS
+    ])
+
+    print(f"\n⏱ Per user: {len(users)} computations in {per_user_time:.2f} s")
+    print(f"⏱ Per cell: {cells} computations in {per_cell_time:.2f} s")
+    print(f"🚀 {len(users) / cells:.0f}x fewer computations, {per_user_time / per_cell_time:.1f}x faster")
+    print(f"🎯 Timings off by one minute: {(diffs == 1).mean() * 100:.2f}%, max difference {diffs.max()} min")
+
+
+if __name__ == "__main__":
+    main()
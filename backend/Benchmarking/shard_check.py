@@ -0,0 +1,309 @@
+"""Multi-process check of the sharded bot (backend/Telegram_handler/bot_cluster.py).
+
+Runs the real cluster: bot_cluster.run_ingress spawns one worker process per
+shard, and every worker restores the shared state file, loads the schedules
+of the users it owns and sends their notifications through its outbox.
+Telegram is the fake Bot API of fake_telegram.py; Supabase is a fake PostgREST
+serving synthetic prayer_times rows whose prayers come a minute after start.
+sendMessage / sendAnimation are then counted per chat, in two rounds:
+
+1. N shards on a fresh state file: every user gets "Time for Dhuhr" and the
+   Dhuhr warning exactly once.
+2. N + 1 shards on the same state file, with Dhuhr due again and Maghrib:
+   every user gets only the Maghrib pair. A user who moved to another shard
+   must not get Dhuhr twice, its dedupe keys follow it through the state file.
+
+After the warnings of a round, every user presses ✅ on theirs. The presses
+come in through getUpdates like real ones, so the ingress routes them, and
+each has to reach the shard holding the reminder: exactly one
+log_ada_prayers call per user.
+
+Each round waits for its prayer times, so the check takes about ten minutes.
+
+    python -m backend.Benchmarking.shard_check --users 500 --shards 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from aiogram.types import Update
+from aiohttp import web
+
+from backend.Benchmarking import fake_telegram
+
+FAKE_SUPABASE_PORT = 8093
+
+os.environ.setdefault("TELEGRAM_TOKEN", fake_telegram.TOKEN)
+os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{fake_telegram.PORT}"
+# The workers must never reach the real database
+os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{FAKE_SUPABASE_PORT}"
+os.environ["SUPABASE_KEY"] = "fake-key"
+
+from backend.Database.prayer_times_cache import CachedPrayerTimes  # noqa: E402
+from backend.Telegram_handler.bot_cluster import route, run_ingress, serialize  # noqa: E402
+from backend.Telegram_handler.scheduler import (  # noqa: E402
+    DEADLINE_TO_PRAYER, FIRE_GRACE, ISHA_REMINDER_TIME, PRAYER, plan_day,
+)
+from backend.Telegram_handler.sharding import shard_of  # noqa: E402
+from backend.Telegram_handler.tg_bot import PrayedCallback  # noqa: E402
+
+
+STARTUP = timedelta(seconds=45)  # for the workers to start and load their schedules
+DEADLINE_AFTER = timedelta(minutes=11)  # keeps the deadline prayers themselves out of the round
+DRAIN = 5  # seconds to keep listening for duplicates once everything arrived
+ANSWER_WAIT = timedelta(seconds=30)  # for the presses to be answered and recorded
+
+ZONES = ["Asia/Tashkent", "Asia/Seoul", "Asia/Kolkata", "Asia/Kathmandu",
+         "Europe/London", "America/New_York", "Australia/Adelaide", "UTC"]
+DEADLINE_OF = {prayer: deadline for deadline, prayer in DEADLINE_TO_PRAYER.items() if prayer}
+PRAYER_NAME = re.compile(r"\b(Fajr|Dhuhr|Asr|Maghrib|Isha)\b")
+
+# ======================
+# FAKE POSTGREST
+# ======================
+prayer_times_rows = []  # the current round's rows, by user_id
+logged = Counter()  # user_id -> log_ada_prayers calls
+CONTENT = {
+    "profile_quotes": [{"id": 1, "quote": "Pray before you are prayed upon"}],
+    "prayer_messages": [{"id": i, "prayer": prayer, "message": "Pray on time"}
+                        for i, prayer in enumerate(["fajr", "dhuhr", "asr", "maghrib", "isha"])],
+    "gifs": [{"id": i, "type": kind, "url": f"https://example.com/{kind}.gif"}
+             for i, kind in enumerate(["judging", "yes", "no"])],
+}
+
+
+async def fake_table(request: web.Request):
+    table = request.match_info["table"]
+    if request.method != "GET":
+        return web.json_response([])
+    if table != "prayer_times":
+        return web.json_response(CONTENT.get(table, []))
+
+    # get_page: order=user_id.asc, limit=N and user_id=gt.<last key>
+    rows = prayer_times_rows
+    after = request.query.get("user_id", "")
+    if after.startswith("gt."):
+        rows = [row for row in rows if row["user_id"] > int(after[3:])]
+    return web.json_response(rows[:int(request.query.get("limit", len(rows)))])
+
+
+async def fake_rpc(request: web.Request):
+    if request.match_info["function"] == "log_ada_prayers":
+        logged[(await request.json())["p_user_id"]] += 1
+    return web.json_response([])
+
+
+async def start_fake_supabase() -> web.AppRunner:
+    app = web.Application()
+    app.router.add_route("*", "/rest/v1/rpc/{function}", fake_rpc)
+    app.router.add_route("*", "/rest/v1/{table}", fake_table)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", FAKE_SUPABASE_PORT).start()
+    return runner
+
+
+# ======================
+# SYNTHETIC DAYS
+# ======================
+def quiet_zones(start: datetime, end: datetime) -> list:
+    """Zones where [start, end] crosses neither local midnight nor the 22:00 Isha reminder"""
+    zones = []
+    for name in ZONES:
+        tz = ZoneInfo(name)
+        local_start, local_end = start.astimezone(tz), end.astimezone(tz)
+        reminder = datetime.combine(local_start.date(), ISHA_REMINDER_TIME, tzinfo=tz)
+        if local_start.date() == local_end.date() and not local_start <= reminder <= local_end:
+            zones.append(name)
+    return zones
+
+
+def make_rows(user_zones: dict, first: datetime, prayers, rng) -> list:
+    """prayer_times rows where each of `prayers` starts at `first` or a minute
+    later, so its warning (10 minutes before the deadline) comes a minute after it"""
+    rows = []
+    for user_id, zone in user_zones.items():
+        tz = ZoneInfo(zone)
+        start = (first + timedelta(minutes=rng.randrange(2))).astimezone(tz)
+        row = {"user_id": user_id, "fajr": None, "sunrise": None, "dhuhr": None,
+               "asr": None, "maghrib": None, "isha": None, "timezone": tz.key}
+        for prayer in prayers:
+            row[prayer] = start.strftime("%H:%M")
+            row[DEADLINE_OF[prayer]] = (start + DEADLINE_AFTER).strftime("%H:%M")
+        rows.append(row)
+    return rows
+
+
+def expected_sends(rows, first: datetime, last: datetime, already: set) -> Counter:
+    """(method, chat_id, prayer) the cluster has to send between first and last.
+
+    `already` holds the dedupe keys of earlier rounds, which the workers read
+    back from the state file; the keys of this round are added to it.
+    """
+    expected = Counter()
+    for row in rows:
+        tz = ZoneInfo(row["timezone"])
+        times = {prayer: datetime.strptime(t, "%H:%M").time()
+                 for prayer, t in row.items() if prayer not in ("user_id", "timezone") and t}
+        for fire_at, kind, prayer in plan_day(CachedPrayerTimes(times=times, tz=tz, row=row), first.astimezone(tz).date()):
+            if not first <= fire_at <= last:
+                continue
+            key = (row["user_id"], kind, prayer, fire_at.date())
+            if key in already:
+                continue
+            already.add(key)
+            method = "sendmessage" if kind == PRAYER else "sendanimation"
+            expected[(method, row["user_id"], prayer)] += 1
+    return expected
+
+
+# ======================
+# CLUSTER ROUNDS
+# ======================
+def press_update(update_id: int, user_id: int, prayer: str, day) -> dict:
+    """Raw Telegram JSON of a ✅ press on a reminder"""
+    user = {"id": user_id, "is_bot": False, "first_name": "Test"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": "1",
+            "data": PrayedCallback(answer="yes", prayer=prayer, day=day.isoformat()).pack(),
+            # date 0 would make it an InaccessibleMessage
+            "message": {"message_id": 1, "date": int(time.time()), "chat": {"id": user_id, "type": "private"}},
+        },
+    }
+
+
+async def run_round(count: int, rows, first: datetime, last: datetime, expected: Counter) -> bool:
+    prayer_times_rows[:] = sorted(rows, key=lambda row: row["user_id"])
+    fake_telegram.sent.clear()
+    fake_telegram.answered.clear()
+    logged.clear()
+    total = sum(expected.values())
+
+    ingress = asyncio.create_task(run_ingress(count))
+    give_up = last + FIRE_GRACE + timedelta(minutes=3)
+    while not ingress.done() and datetime.now(timezone.utc) < give_up:
+        if len(fake_telegram.sent) >= total and datetime.now(timezone.utc) > last + FIRE_GRACE:
+            break
+        await asyncio.sleep(1)
+
+    # Press ✅ on every warning of the round
+    zones = {row["user_id"]: ZoneInfo(row["timezone"]) for row in rows}
+    presses = [
+        press_update(n, user_id, prayer, first.astimezone(zones[user_id]).date())
+        for n, (method, user_id, prayer) in enumerate(expected, start=int(first.timestamp()))
+        if method == "sendanimation"
+    ]
+    fake_telegram.updates.extend(presses)
+    give_up = datetime.now(timezone.utc) + ANSWER_WAIT
+    while not ingress.done() and datetime.now(timezone.utc) < give_up:
+        if len(fake_telegram.answered) >= len(presses) and sum(logged.values()) >= len(presses):
+            break
+        await asyncio.sleep(1)
+
+    await asyncio.sleep(DRAIN)
+    ingress.cancel()
+    await asyncio.gather(ingress, return_exceptions=True)
+
+    # The ✅ replies are GIFs without a caption; notifications name their prayer
+    got = Counter()
+    for method, chat_id, text in fake_telegram.sent:
+        name = PRAYER_NAME.search(text or "")
+        if name:
+            got[(method, chat_id, name.group(1).lower())] += 1
+    extra = sum((got - expected).values())
+    missing = sum((expected - got).values())
+    users_per_shard = Counter(shard_of(row["user_id"], count) for row in rows)
+
+    pressed = Counter(press["callback_query"]["from"]["id"] for press in presses)
+    lost = sum((pressed - logged).values())
+    repeated = sum((logged - pressed).values())
+
+    print(f"{count} shards: {sum(got.values())}/{total} notifications to "
+          f"{len({chat_id for _, chat_id, _ in got})} chats, {extra} duplicated or unexpected, "
+          f"{missing} missing, users per shard {[users_per_shard[i] for i in range(count)]}")
+    print(f"  ✅ presses: {len(fake_telegram.answered)}/{len(presses)} answered, "
+          f"{lost} not recorded by the owning shard, {repeated} recorded twice")
+    return extra == 0 and missing == 0 and lost == 0 and repeated == 0
+
+
+async def check_cluster(user_ids, count: int) -> bool:
+    rng = random.Random(1)
+    now = datetime.now(timezone.utc)
+    zones = quiet_zones(now - timedelta(minutes=2), now + timedelta(minutes=30))
+    user_zones = {user_id: rng.choice(zones) for user_id in user_ids}
+
+    telegram = await fake_telegram.start()
+    supabase = await start_fake_supabase()
+    already = set()
+    ok = True
+    try:
+        for shards, prayers in ((count, ["dhuhr"]), (count + 1, ["dhuhr", "maghrib"])):
+            # Prayer times have whole minutes
+            first = (datetime.now(timezone.utc) + STARTUP).replace(second=0, microsecond=0) + timedelta(minutes=1)
+            last = first + timedelta(minutes=2)
+            rows = make_rows(user_zones, first, prayers, rng)
+            ok &= await run_round(shards, rows, first, last, expected_sends(rows, first, last, already))
+    finally:
+        await supabase.cleanup()
+        await telegram.cleanup()
+    return ok
+
+
+def check_routing(user_ids, count):
+    """Routes real aiogram Updates, serialized the way run_ingress does"""
+    wrong = 0
+    for user_id in user_ids[:10000]:
+        chat = {"id": user_id, "type": "private"}
+        user = {"id": user_id, "is_bot": False, "first_name": "Test"}
+        message = {"update_id": 1, "message": {"message_id": 1, "date": 0, "from": user, "chat": chat, "text": "/start"}}
+        callback = {"update_id": 2, "callback_query": {
+            "id": "1", "from": user, "chat_instance": "1", "data": "prayed:yes:asr:2025-03-21",
+            "message": {"message_id": 1, "date": 0, "chat": chat},
+        }}
+        owner = shard_of(user_id, count)
+        for raw in (message, callback):
+            wrong += route(serialize(Update.model_validate(raw)), count) != owner
+    print(f"routing: {wrong} updates sent to the wrong shard")
+    return wrong == 0
+
+
+def check_rebalance(user_ids, count):
+    moved = sum(1 for user_id in user_ids if shard_of(user_id, count) != shard_of(user_id, count + 1))
+    print(f"{count} -> {count + 1} shards: {moved / len(user_ids):.1%} of users move "
+          f"(ideal {1 / (count + 1):.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--shards", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, stream=sys.stdout, format="[ingress] %(levelname)s %(message)s")
+
+    user_ids = random.Random(0).sample(range(10**6, 8 * 10**9), args.users)
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        # Shared by all workers of both rounds, as in production
+        os.environ["BOT_STATE_PATH"] = os.path.join(state_dir, "bot_state.sqlite3")
+        ok = asyncio.run(check_cluster(user_ids, args.shards))
+    ok &= check_routing(user_ids, args.shards)
+    check_rebalance(user_ids, args.shards)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Webhook pipeline under load, against a local fake Telegram.
+
+Starts a stand-in for the Bot API on localhost, points the bot at it with
+TELEGRAM_API_URL, serves the webhook router with uvicorn and fires button
+presses (callback_query updates) at it at a fixed rate. Prints how fast the
+webhook acks and how long until the handler's answerCallbackQuery reaches
+"Telegram", which is when the button stops spinning for the user.
+
+    python -m backend.Benchmarking.webhook_load --updates 3000 --rate 50
+
+No database is needed: the handlers answer the button before touching it, and
+the later database errors are expected here and not logged.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from aiohttp import ClientSession
+
+from backend.Benchmarking import fake_telegram
+from backend.Benchmarking.fake_telegram import answered
+
+WEBHOOK_PORT = 8092
+SECRET = "load-test-secret"
+
+os.environ.setdefault("TELEGRAM_TOKEN", fake_telegram.TOKEN)
+os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{fake_telegram.PORT}"
+os.environ["WEBHOOK_SECRET"] = SECRET
+
+import uvicorn  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from backend.Telegram_handler import tg_bot, webhook  # noqa: E402
+
+
+def callback_update(n: int) -> dict:
+    user = {"id": 1000 + n, "is_bot": False, "first_name": "Test"}
+    return {
+        "update_id": n,
+        "callback_query": {
+            "id": str(n),
+            "from": user,
+            "chat_instance": "1",
+            "data": "prayed:yes:asr:2025-03-21",
+            "message": {"message_id": n, "date": int(time.time()), "chat": {"id": user["id"], "type": "private"}},
+        },
+    }
+
+
+async def drive(updates: int, rate: float):
+    """Open loop: posts `rate` updates per second whether or not earlier ones are done"""
+    url = f"http://127.0.0.1:{WEBHOOK_PORT}{webhook.WEBHOOK_PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    sent_at, ack = {}, []
+
+    async with ClientSession() as session:
+        async def post(n):
+            sent_at[str(n)] = start = time.monotonic()
+            async with session.post(url, json=callback_update(n), headers=headers) as response:
+                await response.read()
+                ack.append((time.monotonic() - start, response.status))
+
+        started = time.monotonic()
+        posts = []
+        for n in range(updates):
+            posts.append(asyncio.create_task(post(n)))
+            await asyncio.sleep(max(0.0, started + (n + 1) / rate - time.monotonic()))
+        await asyncio.gather(*posts)
+        while len(answered) < updates and time.monotonic() - started < updates / rate + 30:
+            await asyncio.sleep(0.05)
+        elapsed = time.monotonic() - started
+
+    answer = sorted(answered[i] - sent_at[i] for i in answered if i in sent_at)
+    ack_times = sorted(t for t, _ in ack)
+    print(f"{updates} updates at {rate:.0f}/s took {elapsed:.2f}s, "
+          f"{sum(1 for _, status in ack if status != 200)} not acked, {len(answer)} answered")
+    for name, values in (("webhook ack", ack_times), ("button answered", answer)):
+        if values:
+            p50 = values[len(values) // 2] * 1000
+            p99 = values[int(len(values) * 0.99)] * 1000
+            print(f"  {name:16} p50 {p50:6.1f} ms   p99 {p99:6.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--rate", type=float, default=50, help="button presses per second")
+    parser.add_argument("--workers", type=int, default=webhook.UPDATE_WORKERS)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    runner = await fake_telegram.start()
+
+    app = FastAPI()
+    app.include_router(webhook.router)
+    server = uvicorn.Server(uvicorn.Config(app, port=WEBHOOK_PORT, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    bot = tg_bot.create_bot()
+    await webhook.start_pipeline(bot, args.workers)
+    try:
+        await drive(args.updates, args.rate)
+        print(f"  pipeline: {webhook.webhook_stats()}")
+    finally:
+        await webhook.stop_pipeline()
+        await bot.session.close()
+        server.should_exit = True
+        await serving
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
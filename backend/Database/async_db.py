@@ -0,0 +1,18 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+# The supabase Client is synchronous: every call is a blocking HTTP round-trip.
+# Async code runs those calls on this bounded pool instead of on the event
+# loop, so concurrent requests overlap up to DB_WORKERS round-trips at a time.
+DB_WORKERS = int(os.getenv("DB_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database function without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
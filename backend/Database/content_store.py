@@ -0,0 +1,103 @@
+"""Quotes, prayer messages and GIF URLs, kept in memory.
+
+The three tables are small and almost never change, so they are read once
+and picking one is a random.choice over a tuple, with no database read.
+The snapshot is reloaded in a background thread once it is older than
+CONTENT_REFRESH seconds; callers keep using the old one meanwhile. Call
+load_content() to pick up edits right away.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, replace
+
+from backend.Database.qaza_stats import get_all_rows
+
+
+# ======================
+# SETTINGS
+# ======================
+CONTENT_REFRESH = int(os.getenv("CONTENT_REFRESH", "600"))  # seconds
+
+
+@dataclass(frozen=True)
+class Content:
+    quotes: tuple[str, ...]
+    messages: dict[str, tuple[str, ...]]  # prayer -> messages
+    gifs: dict[str, tuple[str, ...]]      # type ('judging', 'yes', 'no') -> urls
+    loaded_at: float
+
+
+# ======================
+# GLOBALS
+# ======================
+_content: Content = None
+_load_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refreshing = False
+
+
+def _group(rows: list, key: str, value: str) -> dict:
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[key], []).append(row[value])
+    return {k: tuple(values) for k, values in groups.items()}
+
+
+def load_content() -> Content:
+    """Read all three tables and swap in the new snapshot"""
+    global _content
+    with _load_lock:
+        content = Content(
+            quotes=tuple(row["quote"] for row in get_all_rows("profile_quotes", "id,quote")),
+            messages=_group(get_all_rows("prayer_messages", "id,prayer,message"), "prayer", "message"),
+            gifs=_group(get_all_rows("gifs", "id,type,url"), "type", "url"),
+            loaded_at=time.monotonic(),
+        )
+        _content = content
+    logging.info(
+        f"Content loaded: {len(content.quotes)} quotes, "
+        f"{sum(map(len, content.messages.values()))} prayer messages, "
+        f"{sum(map(len, content.gifs.values()))} gifs"
+    )
+    return content
+
+
+def _refresh():
+    global _refreshing, _content
+    try:
+        load_content()
+    except Exception as e:
+        # Keep serving the old snapshot and try again after another interval
+        _content = replace(_content, loaded_at=time.monotonic())
+        logging.error(f"Failed to refresh content: {e}")
+    finally:
+        _refreshing = False
+
+
+def _get() -> Content:
+    global _refreshing
+    content = _content
+    if content is None:
+        return load_content()
+    if time.monotonic() - content.loaded_at > CONTENT_REFRESH:
+        with _refresh_lock:
+            if _refreshing:
+                return content
+            _refreshing = True
+        threading.Thread(target=_refresh, name="content-refresh", daemon=True).start()
+    return content
+
+
+def get_profile_quote() -> dict:
+    return {"quote": random.choice(_get().quotes)}
+
+
+def get_prayer_message(prayer: str) -> str:
+    return random.choice(_get().messages[prayer])
+
+
+def get_gif(type: str) -> str:
+    return random.choice(_get().gifs[type])
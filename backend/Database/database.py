@@ -1,8 +1,15 @@
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import os
+import logging
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from postgrest.types import ReturnMethod
 from timezonefinder import TimezoneFinder
-from datetime import date, datetime
+from datetime import date
+from backend.Database.prayer_times_cache import put_prayer_times, invalidate_prayer_times
+from backend.Database.response_cache import bump_user_version
 load_dotenv()
 
 
@@ -11,6 +18,15 @@ key= os.getenv("SUPABASE_KEY")
 
 Client = create_client(url, key)
 
+# "rows": one qazas row per bulk-added prayer
+# "ledger": bulk debt is one qaza_ledger entry per prayer (infra/migrations/0003_qaza_ledger.sql)
+QAZA_STORAGE_MODE = os.getenv("QAZA_STORAGE_MODE", "rows")
+
+# Bulk adds are sent in chunks of this many rows, this many chunks at a time
+BULK_CHUNK_SIZE = 1000
+BULK_MAX_IN_FLIGHT = 4
+_bulk_executor = ThreadPoolExecutor(max_workers=BULK_MAX_IN_FLIGHT, thread_name_prefix="bulk")
+
 tf = TimezoneFinder()
 
 def get_timezone_from_latlon(lat: float, lon: float) -> str | None:
@@ -27,6 +43,7 @@ def insert_user(id,name,lat,lon):
         return None
     else:
         print("Success-Inserted user:", response.data)
+        bump_user_version(id)
         return 1
   
 def insert_prayer_times(user_id,fajr,sunrise,dhuhr,asr,maghrib,isha):
@@ -39,14 +56,18 @@ def insert_prayer_times(user_id,fajr,sunrise,dhuhr,asr,maghrib,isha):
     timezone=get_timezone_from_latlon(response_user.data[0]['lat'],response_user.data[0]['lon'])
     print(timezone)
     
+    row = {"fajr":fajr,"sunrise":sunrise,"dhuhr":dhuhr,"asr":asr,"maghrib":maghrib,"isha":isha,'timezone':timezone}
     response = (
     Client.table("prayer_times")
-    .insert({"user_id":user_id,"fajr":fajr,"sunrise":sunrise,"dhuhr":dhuhr,"asr":asr,"maghrib":maghrib,"isha":isha,'timezone':timezone})
+    .insert({"user_id":user_id, **row})
     .execute()) 
     if not response.data:
+        invalidate_prayer_times(user_id)
         print("Error inserting user:", response.json())
         return None
     else:
+        # Write-through so the scheduler never has to read it back
+        put_prayer_times(user_id, row)
         print("Success-Inserted user:", response.data)
         return 1
  
@@ -60,19 +81,40 @@ def update_prayer_times(user_id,fajr,sunrise,dhuhr,asr,maghrib,isha):
     timezone=get_timezone_from_latlon(response_user.data[0]['lat'],response_user.data[0]['lon'])
     print(timezone)
     
+    row = {"fajr":fajr,"sunrise":sunrise,"dhuhr":dhuhr,"asr":asr,"maghrib":maghrib,"isha":isha,'timezone':timezone}
     response = (
     Client.table("prayer_times")
-    .update({"fajr":fajr,"sunrise":sunrise,"dhuhr":dhuhr,"asr":asr,"maghrib":maghrib,"isha":isha,'timezone':timezone})
+    .update(row)
     .eq("user_id", user_id)
     .execute())
+    if response.data:
+        put_prayer_times(user_id, row)
+    else:
+        invalidate_prayer_times(user_id)
     return bool(response.data)
 
+def upsert_prayer_times_bulk(rows, chunk_size=500):
+    """Insert or update many prayer_times rows ({"user_id", "fajr", ..., "timezone"})
+    with one request per chunk instead of two per user"""
+    written = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        response = (
+        Client.table("prayer_times")
+        .upsert(chunk, on_conflict="user_id")
+        .execute())
+        for row in response.data or []:
+            put_prayer_times(row["user_id"], {k: row[k] for k in ("fajr","sunrise","dhuhr","asr","maghrib","isha","timezone")})
+        written += len(response.data or [])
+    return written
+
 def update_user(id,name,lat,lon):
     response = (
     Client.table("users")
     .update({'name':name,'lat':lat,'lon':lon})
     .eq("id", id)
     .execute())
+    bump_user_version(id)
     return bool(response.data)
     
 def is_user_exist(id):
@@ -87,60 +129,73 @@ def is_user_exist(id):
     return False
 
 
-def add_qaza(prayer, user_id, reason=None):
-    today = date.today()
-    
-    # 1. Remove from daily_prayers if exists
-    Client.table('daily_prayers').delete().eq('user_id', user_id).eq('prayer', prayer).eq('prayer_date', today).execute()
-    
-    # 2. Remove ONLY qazas added from ADA page today
-    today_start = datetime.combine(today, datetime.min.time()).isoformat()
-    today_end = datetime.combine(today, datetime.max.time()).isoformat()
-    Client.table('qazas').delete()\
-        .eq('user_id', user_id)\
-        .eq('prayer', prayer)\
-        .eq('source', 'ada_page')\
-        .gte('time_created', today_start)\
-        .lte('time_created', today_end)\
-        .execute()
-    
-    # 3. Insert with source tracking
-    response = Client.table('qazas').insert({
-        'user_id': user_id,
-        'prayer': prayer,
-        'reason': reason,
-        'source': 'ada_page'
+def log_ada_batch(user_id, prayers, day=None):
+    """Log answers for several prayers of one day (default today) in one round-trip and one transaction.
+
+    prayers is a list of {'prayer': 'fajr', 'status': 'completed' | 'missed', 'reason': ...}.
+    Each entry replaces the day's earlier answer for that prayer, see
+    infra/migrations/0004_log_ada_prayers.sql.
+    """
+    Client.rpc('log_ada_prayers', {
+        'p_user_id': user_id,
+        'p_prayers': prayers,
+        'p_today': (day or date.today()).isoformat()
     }).execute()
-    
+    bump_user_version(user_id)
     return 1
+
+def add_qaza(prayer, user_id, reason=None, day=None):
+    return log_ada_batch(user_id, [{'prayer': prayer, 'status': 'missed', 'reason': reason}], day)
     
-def add_prayer(prayer, user_id):
-    today = date.today()
-    
-    # 1. Remove from daily_prayers if exists
-    Client.table('daily_prayers').delete().eq('user_id', user_id).eq('prayer', prayer).eq('prayer_date', today).execute()
-    
-    
-    # 2. Remove ONLY qazas added from ADA page today (not bulk qazas!)
-    today_start = datetime.combine(today, datetime.min.time()).isoformat()
-    today_end = datetime.combine(today, datetime.max.time()).isoformat()
-    Client.table('qazas').delete()\
-        .eq('user_id', user_id)\
-        .eq('prayer', prayer)\
-        .eq('source', 'ada_page')\
-        .gte('time_created', today_start)\
-        .lte('time_created', today_end)\
-        .execute()
-    
-    # 2. Insert into daily_prayers
-    response = Client.table('daily_prayers').insert({
-        'user_id': user_id,
-        'prayer': prayer,
-    }).execute()
-    
-    return 1
+def add_prayer(prayer, user_id, day=None):
+    return log_ada_batch(user_id, [{'prayer': prayer, 'status': 'completed', 'reason': None}], day)
+
+def _bulk_qaza_rows(user_id, prayer_name, count, batch_id):
+    # Rows are generated lazily, only one chunk of them exists at a time
+    for seq in range(count):
+        yield {
+            'user_id': user_id,
+            'prayer': prayer_name,
+            'reason': None,
+            'source': 'bulk_add',  # ✅ Mark as bulk
+            'batch_id': batch_id,
+            'batch_seq': seq
+        }
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _insert_qaza_chunk(chunk):
+    # Rows of a retried batch already exist and are skipped
+    Client.table('qazas').upsert(
+        chunk,
+        on_conflict='batch_id,prayer,batch_seq',
+        ignore_duplicates=True,
+        returning=ReturnMethod.minimal
+    ).execute()
+    return len(chunk)
+
+def add_bulk_qazas(user_id, fajr=0, dhuhr=0, asr=0, maghrib=0, isha=0, batch_id=None, progress=None):
+    """Add bulk qazas, streamed to the database in fixed-size chunks.
 
-def add_bulk_qazas(user_id, fajr=0, dhuhr=0, asr=0, maghrib=0, isha=0):
+    batch_id makes the call idempotent: retrying with the same id never adds
+    a qaza twice (see infra/migrations/0006_qaza_batches.sql). progress, if
+    given, is called as progress(prayer, inserted, total) after every chunk.
+    """
+    try:
+        return _add_bulk_qazas(user_id, fajr, dhuhr, asr, maghrib, isha, batch_id, progress)
+    finally:
+        # Even a failed call may have inserted some chunks
+        bump_user_version(user_id)
+
+def _add_bulk_qazas(user_id, fajr, dhuhr, asr, maghrib, isha, batch_id, progress):
     prayers_to_add = {
         'fajr': fajr,
         'dhuhr': dhuhr,
@@ -148,21 +203,50 @@ def add_bulk_qazas(user_id, fajr=0, dhuhr=0, asr=0, maghrib=0, isha=0):
         'maghrib': maghrib,
         'isha': isha
     }
+    if batch_id is None:
+        batch_id = str(uuid.uuid4())
+
+    if QAZA_STORAGE_MODE == "ledger":
+        # One entry per prayer, whatever the count
+        entries = [
+            {
+                'user_id': user_id,
+                'prayer': prayer_name,
+                'kind': 'debt',
+                'amount': count,
+                'source': 'bulk_add',
+                'batch_id': batch_id
+            }
+            for prayer_name, count in prayers_to_add.items()
+            if count > 0
+        ]
+        if entries:
+            Client.table('qaza_ledger').upsert(
+                entries,
+                on_conflict='batch_id,prayer',
+                ignore_duplicates=True,
+                returning=ReturnMethod.minimal
+            ).execute()
+        return 1
     
     for prayer_name, count in prayers_to_add.items():
-        if count > 0:
-            qaza_entries = [
-                {
-                    'user_id': user_id,
-                    'prayer': prayer_name,
-                    'reason': None,
-                    'source': 'bulk_add'  # ✅ Mark as bulk
-                }
-                for _ in range(count)
-            ]
-            
-            if qaza_entries:
-                Client.table('qazas').insert(qaza_entries).execute()
+        if count <= 0:
+            continue
+
+        # At most BULK_MAX_IN_FLIGHT chunks are being sent (and held in memory) at once
+        in_flight = deque()
+        inserted = 0
+        for chunk in _chunks(_bulk_qaza_rows(user_id, prayer_name, count, batch_id), BULK_CHUNK_SIZE):
+            if len(in_flight) >= BULK_MAX_IN_FLIGHT:
+                inserted += in_flight.popleft().result()
+                if progress:
+                    progress(prayer_name, inserted, count)
+            in_flight.append(_bulk_executor.submit(_insert_qaza_chunk, chunk))
+
+        while in_flight:
+            inserted += in_flight.popleft().result()
+            if progress:
+                progress(prayer_name, inserted, count)
     
     return 1
 
@@ -191,6 +275,7 @@ def update_qaza(prayer, user_id):
         .eq('id', prayer_id)
         .execute()
     )
+    bump_user_version(user_id)
 
     return 1
 
@@ -198,7 +283,11 @@ def update_qaza(prayer, user_id):
 
 
 def mark_qazas_prayed(user_id, fajr=0, dhuhr=0, asr=0, maghrib=0, isha=0):
-    
+    """Clear the oldest outstanding qazas of each prayer in one round-trip.
+
+    Returns the outstanding count of every prayer afterwards,
+    see infra/migrations/0005_clear_oldest_qazas.sql.
+    """
     prayers_to_clear = {
         'fajr': fajr,
         'dhuhr': dhuhr,
@@ -206,31 +295,20 @@ def mark_qazas_prayed(user_id, fajr=0, dhuhr=0, asr=0, maghrib=0, isha=0):
         'maghrib': maghrib,
         'isha': isha
     }
-    
-    for prayer_name, count in prayers_to_clear.items():
-        if count > 0:
-            # Get the OLDEST qazas that are still unpaid (is_qaza = true)
-            # Order by id ASC to get oldest first
-            oldest_qazas = Client.table('qazas')\
-                .select('id')\
-                .eq('user_id', user_id)\
-                .eq('prayer', prayer_name)\
-                .eq('is_qaza', True)\
-                .order('id', desc=False)\
-                .limit(count)\
-                .execute()
-            
-            # Extract the IDs
-            qaza_ids = [qaza['id'] for qaza in oldest_qazas.data]
-            
-            # Update those specific qazas
-            if qaza_ids:
-                Client.table('qazas')\
-                    .update({
-                        'is_qaza': False,
-                        'time_prayed': datetime.now().isoformat()
-                    })\
-                    .in_('id', qaza_ids)\
-                    .execute()
-    
-    return 1
\ No newline at end of file
+
+    response = Client.rpc('clear_oldest_qazas', {
+        'p_user_id': user_id,
+        'p_counts': prayers_to_clear
+    }).execute()
+    bump_user_version(user_id)
+
+    return response.data
+
+
+def reconcile_qaza_counters(user_id=None):
+    """Check qaza_counters against qazas, repair drift and return the drifted rows"""
+    response = Client.rpc('reconcile_qaza_counters', {'p_user_id': user_id}).execute()
+    for row in response.data or []:
+        logging.warning(f"Repaired qaza counter drift: {row}")
+        bump_user_version(row["user_id"])
+    return response.data or []
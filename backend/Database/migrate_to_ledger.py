@@ -0,0 +1,58 @@
+"""Folds existing bulk_add qazas rows into the compact qaza_ledger.
+
+Run from the repo root, after applying infra/migrations/0003_qaza_ledger.sql:
+    python -m backend.Database.migrate_to_ledger [--user USER_ID]
+
+Each user is compacted in its own transaction by the compact_bulk_qazas RPC,
+so the tool can be stopped and re-run at any time. Set QAZA_STORAGE_MODE=ledger
+for the API so new bulk debt goes to the ledger as well.
+"""
+import argparse
+import time
+
+from backend.Database.database import Client
+
+
+def migrate_user(user_id):
+    return Client.rpc('compact_bulk_qazas', {'p_user_id': user_id}).execute().data
+
+
+def user_ids(page_size=1000):
+    start = 0
+    while True:
+        res = (
+            Client
+            .table("users")
+            .select("id")
+            .order("id")
+            .range(start, start + page_size - 1)
+            .execute()
+        )
+        for row in res.data:
+            yield row["id"]
+        if len(res.data) < page_size:
+            return
+        start += page_size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user", type=int, help="only migrate this user")
+    args = parser.parse_args()
+
+    started = time.time()
+    users = [args.user] if args.user else user_ids()
+    total_users = total_rows = 0
+
+    for user_id in users:
+        rows = migrate_user(user_id)
+        total_users += 1
+        total_rows += rows
+        if rows:
+            print(f"👤 {user_id}: {rows} rows folded into the ledger")
+
+    print(f"\n✅ {total_users} users, {total_rows} rows folded in {time.time() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
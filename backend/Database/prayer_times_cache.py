@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from datetime import datetime, time
+from zoneinfo import ZoneInfo
+import threading
+
+from backend.Database.qaza_stats import get_prayer_times
+
+
+@dataclass(frozen=True)
+class CachedPrayerTimes:
+    times: dict[str, time]  # prayer -> local time of day
+    tz: ZoneInfo
+    row: dict  # the prayer_times row as stored ("HH:MM" strings + timezone name)
+
+
+# user_id -> CachedPrayerTimes
+# prayer_times rows only change in update_prayer_times/insert_prayer_times,
+# which write through to this cache, so entries never go stale on their own.
+_cache: dict[int, CachedPrayerTimes] = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _parse(row: dict) -> CachedPrayerTimes:
+    times = {}
+    for prayer, time_str in row.items():
+        if prayer == "timezone" or not time_str:
+            continue
+        times[prayer] = datetime.strptime(time_str, "%H:%M").time()
+    return CachedPrayerTimes(times=times, tz=ZoneInfo(row["timezone"]), row=dict(row))
+
+
+def get_cached_prayer_times(user_id: int) -> CachedPrayerTimes:
+    entry = _cache.get(user_id)
+    if entry is not None:
+        with _lock:
+            _stats["hits"] += 1
+        return entry
+
+    with _lock:
+        _stats["misses"] += 1
+    return put_prayer_times(user_id, get_prayer_times(user_id))
+
+
+def put_prayer_times(user_id: int, row: dict, replace: bool = True) -> CachedPrayerTimes:
+    """Cache a prayer_times row. With replace=False an entry that is already
+    cached wins, e.g. a bulk read must not undo a write that happened meanwhile."""
+    if not replace and user_id in _cache:
+        return _cache[user_id]
+    entry = _parse(row)
+    _cache[user_id] = entry
+    return entry
+
+
+def invalidate_prayer_times(user_id: int):
+    _cache.pop(user_id, None)
+
+
+def prayer_times_cache_stats() -> dict:
+    with _lock:
+        return {**_stats, "size": len(_cache)}
@@ -1,8 +1,7 @@
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import os
-from datetime import  datetime, timedelta, time, date
-import random
+from datetime import timedelta, date
 import logging
 
 
@@ -27,29 +26,68 @@ def get_user_info(user_id: int):
     return res.data[0]
 
 
-def get_all_users():
-    res = (
+# PostgREST returns at most this many rows per request (Supabase's default max-rows)
+PAGE_SIZE = 1000
+
+
+def get_page(table: str, columns: str, key: str = "id", after=None, page_size: int = PAGE_SIZE):
+    """One page of a table in key order, starting after the key value `after`.
+
+    Keyset pagination: each page is an index range scan, unlike offsets.
+    Returns the rows; fewer than page_size means it was the last page.
+    """
+    query = (
         Client
-        .table("users")
-        .select("id,lat,lon")
-        .execute()
+        .table(table)
+        .select(columns)
+        .order(key)
+        .limit(page_size)
     )
+    if after is not None:
+        query = query.gt(key, after)
+    return query.execute().data
+
+
+def get_all_rows(table: str, columns: str, key: str = "id"):
+    rows = []
+    after = None
+    while True:
+        page = get_page(table, columns, key, after)
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        after = page[-1][key]
 
-    return res.data
+
+def get_all_users():
+    return get_all_rows("users", "id,lat,lon")
+
+
+def get_all_user_locations():
+    """All users with their coordinates and the timezone stored with their prayer times"""
+    users = []
+    for row in get_all_rows("users", "id,lat,lon,prayer_times(timezone)"):
+        prayer_times = row.pop("prayer_times", None)
+        if isinstance(prayer_times, list):
+            prayer_times = prayer_times[0] if prayer_times else None
+        row["timezone"] = prayer_times["timezone"] if prayer_times else None
+        users.append(row)
+    return users
 
  
 
 def get_total_qazas(user_id):
+    # qaza_counters is kept up to date by triggers on qazas,
+    # see infra/migrations/0002_qaza_counters.sql
     res = (
         Client
-        .table("qazas")
-        .select("id", count="exact")
+        .table("qaza_counters")
+        .select("outstanding")
         .eq("user_id", user_id)
-        .eq("is_qaza", True)
         .execute()
     )
 
-    return res.count
+    return sum(row["outstanding"] for row in res.data)
 
 
 
@@ -57,8 +95,8 @@ def get_total_qazas(user_id):
 def qazas_rating(user_id):
     res = (
         Client
-        .table("qaza_counts")
-        .select("prayer, counts")
+        .table("qaza_counters")
+        .select("prayer, outstanding")
         .eq("user_id", user_id)
         .execute()
     )
@@ -75,7 +113,7 @@ def qazas_rating(user_id):
     # Overwrite only existing prayers
     if res.data:
         for row in res.data:
-            breakdown[row["prayer"]] = row["counts"]
+            breakdown[row["prayer"]] = row["outstanding"]
 
     return breakdown
 
@@ -85,85 +123,21 @@ def qazas_rating(user_id):
     
 
 def get_prayers_stats(user_id: int):
-    
-    stats={}
-
-    today = date.today()
-    start = datetime.combine(today, time.min)
-    end = datetime.combine(today, time.max)
-    
-
-    
-    res = (
-        Client
-        .table("daily_prayers")
-        .select("id", count="exact")
-        .eq("user_id", user_id)
-        .eq("prayer_date", today.isoformat())
-        .execute()
-    )
-
-    stats['completed_today'] = res.count
-    
-    
-    res = (
-        Client
-        .table("users")
-        .select("daily_goal", count="exact")
-        .eq("id", user_id)
-        .execute())
-    stats['daily_goal']=res.data[0]['daily_goal']
-    
-    
-    today = date.today()
-    start = datetime.combine(today - timedelta(days=6), time.min)
-    end = datetime.combine(today, time.max)
-    res = (
-    Client
-    .table("qazas")
-    .select("id", count="exact")
-    .eq("user_id", user_id)
-    .eq("is_qaza", False)
-    .gte("time_prayed", start.isoformat())
-    .lte("time_prayed", end.isoformat())
-    .execute())   
-    stats["cleared_this_week"] = res.count
-    
-    
-    res = (
-    Client
-    .table("qazas")
-    .select("id", count="exact")
-    .eq("user_id", user_id)
-    .execute())
-    stats["total_prayers_logged"] = res.count
-    
-    
+    # All five numbers (and the streak) come from one RPC,
+    # see infra/migrations/0001_get_prayer_stats.sql
     res = (
         Client
-        .table("qazas")
-        .select("time_prayed")
-        .eq("user_id", user_id)
-        .eq("is_qaza", False)
+        .rpc(
+            'get_prayer_stats',
+            {
+                'p_user_id': user_id,
+                'p_today': date.today().isoformat()
+            }
+        )
         .execute()
     )
 
-    prayed_dates = {
-        row["time_prayed"][:10]
-        for row in res.data
-        if row["time_prayed"]
-    }
-
-    streak = 0
-    current_day = date.today()
-
-    while current_day.isoformat() in prayed_dates:
-        streak += 1
-        current_day -= timedelta(days=1)
-    
-    stats['current_streak']=streak
-    
-    return stats
+    return res.data
 
     
 def get_weekly_activity(user_id: int):
@@ -208,29 +182,6 @@ def get_weekly_activity(user_id: int):
 
 
 
-def get_profile_quote():
-    res = (
-        Client
-        .table("profile_quotes")
-        .select("quote")
-        .execute()
-    )
-    quote=random.choice(res.data)
-    return quote
-
-
-def get_prayer_message(prayer):
-    res = (
-        Client
-        .table("prayer_messages")
-        .select("message")
-        .eq('prayer',prayer)
-        .execute()
-    )
-    message=random.choice(res.data)
-    return message['message']
-
-
 def get_prayer_times(user_id : int):
     res = (
         Client
@@ -244,17 +195,29 @@ def get_prayer_times(user_id : int):
 
 
 
-def get_gif(type):
-    res = (
-        Client
-        .table("gifs")
-        .select("url")
-        .eq("type", type)
-        .execute()
-    )
-    
-    return random.choice(res.data)['url']
-    
+def get_ledger_cleared(user_id: int, start: date, end: date):
+    """Prayers cleared in the qaza_ledger from start until before end"""
+    cleared = 0
+    after = None
+    while True:
+        query = (
+            Client
+            .table("qaza_ledger")
+            .select("id,amount")
+            .eq("user_id", user_id)
+            .eq("kind", "cleared")
+            .gte("created", start.isoformat())
+            .lt("created", end.isoformat())
+            .order("id")
+            .limit(PAGE_SIZE)
+        )
+        if after is not None:
+            query = query.gt("id", after)
+        page = query.execute().data
+        cleared += sum(row["amount"] for row in page)
+        if len(page) < PAGE_SIZE:
+            return cleared
+        after = page[-1]["id"]
 
 
 def get_monthly_data(user_id: int, year: int, month: int):
@@ -274,6 +237,12 @@ def get_monthly_data(user_id: int, year: int, month: int):
     
     data = res.data 
 
+    # Prayers made up through the ledger (infra/migrations/0003_qaza_ledger.sql)
+    # are not qazas rows, so the RPC's qazaDone misses them
+    first_day = date(year, month, 1)
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    data['monthSummary']['qazaDone'] += get_ledger_cleared(user_id, first_day, next_month)
+
     total_prayers = data['monthSummary']['adaPrayers'] + data['monthSummary']['missed']
     if total_prayers > 0:
         data['monthSummary']['completionRate'] = round(
@@ -0,0 +1,165 @@
+"""Cache of the API's per-user read results, invalidated by a per-user version.
+
+Every write path in database.py calls bump_user_version(user_id) after it
+succeeds. Entries are keyed by (endpoint, user_id, params, version), so a bump
+makes all of the user's old entries unreachable at once; they then age out of
+the LRU.
+
+With REDIS_URL set (and the optional redis package installed), versions and
+results are shared through Redis, so writes made by the bot process invalidate
+the API's entries right away. Without Redis the cache is off: a bump is only
+seen by the process that made it, and the polling bot and extra API workers
+or instances write from other processes. RESPONSE_CACHE=memory keeps it in
+this process instead, and is only accepted together with BOT_MODE=webhook,
+for a single API process that also runs the bot.
+"""
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+# ======================
+# SETTINGS
+# ======================
+CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))  # entries kept in memory
+CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "60"))       # seconds
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_PREFIX = "qaza:"
+# "memory": cache in this process without Redis; see the module docstring
+CACHE_MODE = os.getenv("RESPONSE_CACHE")
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# ======================
+# GLOBALS
+# ======================
+_versions = {}  # user_id -> version, when Redis is not used
+_entries = OrderedDict()  # (endpoint, user_id, params, version) -> (value, expires)
+_lock = threading.Lock()
+_stats = {"hits": 0, "redis_hits": 0, "misses": 0, "bumps": 0}
+_redis = None
+_enabled = False
+# Memory-only versions are counters of this process, which restart at 0 and
+# so must not match the ETags handed out before a restart
+_process_tag = secrets.token_hex(4)
+
+if REDIS_URL and redis is not None:
+    _redis = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5)
+    _enabled = True
+elif REDIS_URL:
+    logging.warning("REDIS_URL is set but the redis package is missing, response cache disabled")
+elif CACHE_MODE == "memory" and BOT_MODE != "webhook":
+    logging.warning(
+        "RESPONSE_CACHE=memory needs BOT_MODE=webhook: the polling bot writes from "
+        "another process, whose changes this cache would not see. Response cache disabled"
+    )
+elif CACHE_MODE == "memory":
+    _enabled = True
+
+
+def user_version(user_id: int) -> int:
+    if _redis is not None:
+        try:
+            return int(_redis.get(f"{REDIS_PREFIX}v:{user_id}") or 0)
+        except redis.RedisError as e:
+            logging.warning(f"Redis unavailable, reading user {user_id} uncached: {e}")
+            return -1  # never cached
+    with _lock:
+        return _versions.get(user_id, 0)
+
+
+def bump_user_version(user_id: int):
+    """Invalidate every cached result of a user; call after each write"""
+    with _lock:
+        _stats["bumps"] += 1
+        _versions[user_id] = _versions.get(user_id, 0) + 1
+    if _redis is not None:
+        try:
+            _redis.incr(f"{REDIS_PREFIX}v:{user_id}")
+        except redis.RedisError as e:
+            logging.error(f"Failed to bump cache version of user {user_id}: {e}")
+
+
+def cached(endpoint: str, user_id: int, params: tuple, compute):
+    """Return compute()'s result for this user and params, from the cache when
+    the user's data hasn't changed since it was stored."""
+    if not _enabled:
+        return compute()
+    version = user_version(user_id)
+    if version < 0:
+        return compute()
+    key = (endpoint, user_id, params, version)
+    now = time.monotonic()
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[1] > now:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[0]
+
+    value = None
+    if _redis is not None:
+        redis_key = f"{REDIS_PREFIX}r:{endpoint}:{user_id}:{json.dumps(params)}:{version}"
+        try:
+            stored = _redis.get(redis_key)
+            if stored is not None:
+                value = json.loads(stored)
+        except redis.RedisError:
+            stored = None
+
+    if value is not None:
+        stat = "redis_hits"
+    else:
+        stat = "misses"
+        value = compute()
+        if _redis is not None:
+            try:
+                _redis.setex(redis_key, CACHE_TTL, json.dumps(value, default=str))
+            except redis.RedisError:
+                pass
+
+    with _lock:
+        _stats[stat] += 1
+        _entries[key] = (value, now + CACHE_TTL)
+        _entries.move_to_end(key)
+        while len(_entries) > CACHE_SIZE:
+            _entries.popitem(last=False)
+    return value
+
+
+def user_etag(user_id: int, *parts) -> str:
+    """ETag for one resource derived from a user's data, None if unknown.
+
+    parts name the resource (endpoint, params), since every resource of a user
+    shares the version. The tag changes with the version and the date (stats
+    and the weekly view are relative to today). In memory mode it also names
+    this process, whose versions restart at 0. None while the cache is off.
+
+    The tag is weak: the same tag is sent for the gzip, brotli and identity
+    bodies of a response.
+    """
+    if not _enabled:
+        return None
+    version = user_version(user_id)
+    if version < 0:
+        return None
+    tag = "-".join(str(part) for part in parts)
+    tag += f"-{version}-{date.today().isoformat()}"
+    if _redis is None:
+        tag += f"-{_process_tag}"
+    return f'W/"{tag}"'
+
+
+def response_cache_stats() -> dict:
+    with _lock:
+        return {**_stats, "size": len(_entries), "enabled": _enabled, "redis": _redis is not None}
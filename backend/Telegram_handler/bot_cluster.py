@@ -0,0 +1,141 @@
+"""Sharded bot: one ingress process, N worker processes.
+
+    python -m backend.Telegram_handler.bot_cluster --shards 4
+
+The ingress polls Telegram and puts every update on the queue of the worker
+that owns its user (jump hash of the user id, see sharding.py). Each worker
+runs the normal dispatcher, scheduler and outbox of tg_bot.py, but only for
+its own users, so every user's notifications come from exactly one process.
+
+To change the number of workers, restart with a new --shards. Jump hashing
+moves only ~1/N of the users, and their pending reminders and dedupe keys
+follow them because all workers share the SQLite state file (BOT_STATE_PATH).
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import queue as queue_errors
+import sys
+from functools import partial
+
+from aiogram.types import Update
+
+from backend.Telegram_handler import tg_bot
+from backend.Telegram_handler.sharding import SHARDS, shard_of, update_user_id
+
+
+POLL_TIMEOUT = 30          # seconds, Telegram long polling
+QUEUE_SIZE = 10000         # updates waiting per worker
+PUT_TIMEOUT = 2            # seconds to wait for room in a full worker queue
+
+
+# ======================
+# WORKER
+# ======================
+async def run_worker(index: int, count: int, queue):
+    tg_bot.configure_shard(index, count)
+    bot = tg_bot.create_bot()
+    flusher = await tg_bot.start_services(bot)
+    logging.info(f"Shard {index}/{count} ready")
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:  # shutdown
+                break
+            update = Update.model_validate(data, context={"bot": bot})
+            asyncio.create_task(tg_bot.dp.feed_update(bot, update))
+    finally:
+        await tg_bot.stop_services(flusher)
+        await bot.session.close()
+
+
+def worker_main(index: int, count: int, queue):
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format=f"[shard {index}] %(levelname)s %(message)s")
+    asyncio.run(run_worker(index, count, queue))
+
+
+# ======================
+# INGRESS
+# ======================
+def serialize(update: Update) -> dict:
+    """Raw Telegram JSON of an update, for route() and the workers.
+
+    by_alias keeps the sender under "from" (not "from_user"), where
+    update_user_id looks for it.
+    """
+    return update.model_dump(mode="json", exclude_none=True, by_alias=True)
+
+
+def route(data: dict, count: int) -> int:
+    user_id = update_user_id(data)
+    return shard_of(user_id, count) if user_id is not None else 0
+
+
+def _start_worker(ctx, index: int, count: int, queue):
+    process = ctx.Process(target=worker_main, args=(index, count, queue), name=f"bot-shard-{index}", daemon=True)
+    process.start()
+    return process
+
+
+async def run_ingress(count: int):
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue(QUEUE_SIZE) for _ in range(count)]
+    workers = [_start_worker(ctx, i, count, queues[i]) for i in range(count)]
+
+    bot = tg_bot.create_bot()
+    await tg_bot.set_menu_button(bot)
+    await bot.delete_webhook(drop_pending_updates=True)
+
+    offset = None
+    try:
+        while True:
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    logging.error(f"Shard {i} exited with {process.exitcode}, restarting")
+                    workers[i] = _start_worker(ctx, i, count, queues[i])
+
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT)
+            except Exception as e:
+                logging.error(f"Polling failed: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            stalled = set()  # shards whose queue stayed full during this batch
+            for update in updates:
+                offset = update.update_id + 1
+                data = serialize(update)
+                shard = route(data, count)
+                try:
+                    queues[shard].put_nowait(data)
+                    continue
+                except queue_errors.Full:
+                    pass
+                # A stalled worker must not hold up polling for the other shards
+                if shard not in stalled:
+                    try:
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, partial(queues[shard].put, data, timeout=PUT_TIMEOUT)
+                        )
+                        continue
+                    except queue_errors.Full:
+                        stalled.add(shard)
+                logging.error(f"Shard {shard} queue is full, dropping update {update.update_id}")
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for process in workers:
+            process.join(timeout=10)
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=None, help="worker processes (default BOT_SHARDS or 1)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format="[ingress] %(levelname)s %(message)s")
+    asyncio.run(run_ingress(args.shards or SHARDS))
@@ -0,0 +1,110 @@
+import os
+import re
+import sqlite3
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+# ======================
+# SETTINGS
+# ======================
+CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+MEMORY_SIZE = 1024
+TTL = 30 * 86400           # cities don't move
+NEGATIVE_TTL = 86400       # "city not found" is retried after a day
+
+# Cyrillic -> Latin, following the Uzbek Latin alphabet so "Тошкент" and
+# "Toshkent" meet; Russian spellings like "Ташкент" end up as "tashkent"
+CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo",
+    "ж": "j", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "x", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "",
+    "ы": "i", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "ў": "o", "қ": "q", "ғ": "g", "ҳ": "h",
+}
+
+_APOSTROPHES = re.compile(r"[\'`ʻʼ‘’]")
+_SEPARATORS = re.compile(r"[\s\-_.,]+")
+
+
+def normalize_city(name: str) -> str:
+    """Cache key of a typed city name: case-folded, transliterated, without accents"""
+    name = unicodedata.normalize("NFKC", name).casefold()
+    name = "".join(CYRILLIC_TO_LATIN.get(ch, ch) for ch in name)
+    name = "".join(
+        ch for ch in unicodedata.normalize("NFKD", name)
+        if not unicodedata.combining(ch)
+    )
+    name = _APOSTROPHES.sub("", name)
+    return _SEPARATORS.sub(" ", name).strip()
+
+
+# ======================
+# GLOBALS
+# ======================
+_memory = OrderedDict()  # key -> (coords or None, expires)
+_lock = threading.Lock()
+_db = None
+
+
+def _connection():
+    global _db
+    if _db is None:
+        _db = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _db.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            " name TEXT PRIMARY KEY,"
+            " lat TEXT,"   # NULL lat/lon = city not found
+            " lon TEXT,"
+            " expires REAL NOT NULL)"
+        )
+        _db.commit()
+    return _db
+
+
+def _remember(key, coords, expires):
+    _memory[key] = (coords, expires)
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_SIZE:
+        _memory.popitem(last=False)
+
+
+def lookup(name: str):
+    """Return (found, coords). coords is None for a cached "city not found"."""
+    key = normalize_city(name)
+    now = time.time()
+
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None and entry[1] > now:
+            _memory.move_to_end(key)
+            return True, entry[0]
+
+        row = _connection().execute(
+            "SELECT lat, lon, expires FROM geocode WHERE name = ?", (key,)
+        ).fetchone()
+        if row is None or row[2] <= now:
+            return False, None
+
+        coords = (row[0], row[1]) if row[0] is not None else None
+        _remember(key, coords, row[2])
+        return True, coords
+
+
+def store(name: str, coords):
+    """Cache coords (lat, lon) of a city name, or None if it wasn't found"""
+    key = normalize_city(name)
+    expires = time.time() + (TTL if coords is not None else NEGATIVE_TTL)
+    lat, lon = coords if coords is not None else (None, None)
+
+    with _lock:
+        _remember(key, coords, expires)
+        db = _connection()
+        db.execute(
+            "INSERT OR REPLACE INTO geocode (name, lat, lon, expires) VALUES (?, ?, ?, ?)",
+            (key, lat, lon, expires),
+        )
+        db.commit()
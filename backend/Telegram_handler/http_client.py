@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import random
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+# ======================
+# SETTINGS
+# ======================
+USER_AGENT = "Mozilla/5.0 (TelegramBot)"
+TIMEOUT = aiohttp.ClientTimeout(total=10, connect=5)
+MAX_CONNECTIONS = 20      # pooled keep-alive connections, all hosts together
+MAX_CONCURRENCY = 10      # requests in flight at once
+RETRIES = 3
+BACKOFF_BASE = 0.5        # seconds, doubled on every retry and jittered
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Minimum seconds between two requests to the same host
+# Nominatim's usage policy allows at most 1 request per second
+HOST_MIN_INTERVAL = {
+    "nominatim.openstreetmap.org": 1.0,
+}
+
+# ======================
+# GLOBALS
+# ======================
+_session = None
+_semaphore = None
+_host_locks = {}
+_host_next_slot = {}
+
+
+async def get_session() -> aiohttp.ClientSession:
+    global _session, _semaphore
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS, keepalive_timeout=30),
+            timeout=TIMEOUT,
+            headers={"User-Agent": USER_AGENT},
+        )
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def _wait_for_host(host: str):
+    """Per-host rate limiter: waits until the host's next free slot"""
+    interval = HOST_MIN_INTERVAL.get(host)
+    if not interval:
+        return
+
+    lock = _host_locks.setdefault(host, asyncio.Lock())
+    async with lock:
+        now = time.monotonic()
+        next_slot = _host_next_slot.get(host, now)
+        if next_slot > now:
+            await asyncio.sleep(next_slot - now)
+        _host_next_slot[host] = max(now, next_slot) + interval
+
+
+def _backoff(attempt: int, retry_after=None) -> float:
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, BACKOFF_BASE * 2 ** attempt)
+
+
+async def get_json(url: str, params=None, headers=None):
+    """GET a JSON document through the shared pool with retries.
+
+    Raises the last error once all retries are used up.
+    """
+    session = await get_session()
+    host = urlsplit(url).hostname
+
+    for attempt in range(RETRIES + 1):
+        retry_after = None
+        try:
+            await _wait_for_host(host)
+            async with _semaphore:
+                async with session.get(url, params=params, headers=headers) as response:
+                    if response.status in RETRY_STATUSES and attempt < RETRIES:
+                        header = response.headers.get("Retry-After")
+                        retry_after = float(header) if header and header.isdigit() else None
+                        logging.warning(f"GET {host} returned {response.status}, retrying")
+                    else:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+        except aiohttp.ClientResponseError:
+            raise  # a 4xx will not get better by retrying
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == RETRIES:
+                raise
+            logging.warning(f"GET {host} failed ({e!r}), retrying")
+
+        await asyncio.sleep(_backoff(attempt, retry_after))
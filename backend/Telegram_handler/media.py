@@ -0,0 +1,77 @@
+"""Telegram file_ids of the GIFs the bot sends.
+
+Sending a GIF by URL makes Telegram download and process it again for every
+message. The first send of a URL captures the file_id Telegram returns; later
+sends reuse it, and the mapping is saved with the bot state (state_store.py) so
+it survives restarts. A file_id Telegram rejects is dropped and the URL is sent
+again, which captures a fresh one.
+"""
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from backend.Telegram_handler import state_store
+
+
+# ======================
+# GLOBALS
+# ======================
+_file_ids = {}      # url -> file_id
+_uploading = {}     # url -> Event, set when the first send of the url finished
+_stats = {"by_file_id": 0, "by_url": 0, "rejected": 0}
+
+
+def restore(file_ids: dict):
+    _file_ids.update(file_ids)
+
+
+def _remember(url: str, message: Message):
+    media = message.animation or message.document
+    if media is None:
+        return
+    if _file_ids.get(url) != media.file_id:
+        _file_ids[url] = media.file_id
+        state_store.set_media(url, media.file_id)
+
+
+async def send_animation(url: str, send) -> Message:
+    """Send a GIF, by file_id once one is known.
+
+    `send` is called with the animation (file_id or URL) and returns the
+    awaitable that sends it, e.g. an outbox.submit(...).
+    """
+    file_id = _file_ids.get(url)
+    if file_id is None and url in _uploading:
+        # Reminders go out in bursts; let the first send of a new GIF capture
+        # its file_id instead of every one of them sending the URL
+        await _uploading[url].wait()
+        file_id = _file_ids.get(url)
+
+    if file_id is not None:
+        try:
+            message = await send(file_id)
+            _stats["by_file_id"] += 1
+            return message
+        except TelegramBadRequest as e:
+            logging.warning(f"file_id of {url} was rejected, sending the URL: {e}")
+            _stats["rejected"] += 1
+            if _file_ids.get(url) == file_id:
+                del _file_ids[url]
+                state_store.forget_media(url)
+
+    uploading = _uploading.setdefault(url, asyncio.Event())
+    try:
+        message = await send(url)
+        _stats["by_url"] += 1
+        _remember(url, message)
+        return message
+    finally:
+        uploading.set()
+        if _uploading.get(url) is uploading:
+            del _uploading[url]
+
+
+def media_stats() -> dict:
+    return {**_stats, "file_ids": len(_file_ids)}
@@ -0,0 +1,208 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramRetryAfter
+
+
+# ======================
+# SETTINGS
+# ======================
+# Telegram allows about 30 messages per second in total and 1 per second to
+# the same chat; stay a bit below so other bot traffic still fits
+GLOBAL_RATE = 25          # messages per second, all chats together
+GLOBAL_BURST = 5           # tokens saved up while idle
+CHAT_INTERVAL = 1.0       # seconds between two messages to the same chat
+MAX_IN_FLIGHT = 25
+MAX_RETRIES = 3           # attempts after a 429 before giving up
+STATS_INTERVAL = 60       # seconds between metric log lines
+
+# Priorities, lower is sent first
+URGENT = 0   # pre-deadline warnings
+NORMAL = 1   # "Time for X"
+LOW = 2      # cleanup of old messages
+
+# ======================
+# GLOBALS
+# ======================
+# Heap of (priority, seq, item) ready to go
+_ready = []
+# Heap of (not_before, seq, item) waiting for their chat or a 429 to pass
+_waiting = []
+_seq = itertools.count()
+_wakeup = asyncio.Event()
+_chat_next_slot = {}
+_paused_until = 0.0
+_tokens = float(GLOBAL_BURST)
+_tokens_at = time.monotonic()
+_in_flight = 0
+_rate_share = 1.0
+
+_lags = deque(maxlen=1000)  # seconds from submit to delivery
+_stats = {"sent": 0, "failed": 0, "retried": 0}
+
+
+def set_rate_share(share: float):
+    """Use only this fraction of the global rate, when several processes send for the same bot"""
+    global _rate_share
+    _rate_share = share
+
+
+class _Item:
+    __slots__ = ("call", "chat_id", "priority", "future", "submitted", "attempts")
+
+    def __init__(self, call, chat_id, priority, future):
+        self.call = call
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = future
+        self.submitted = time.monotonic()
+        self.attempts = 0
+
+
+async def submit(call, chat_id=None, priority=NORMAL):
+    """Queue a Bot API call and wait for its result.
+
+    call is a zero-argument coroutine function, e.g.
+    partial(bot.send_message, chat_id=user_id, text=...). Calls with a chat_id
+    are paced to one per CHAT_INTERVAL for that chat; leave it out for calls
+    that don't post a message (deletes). Errors of the call are raised here.
+    """
+    future = asyncio.get_running_loop().create_future()
+    heapq.heappush(_ready, (priority, next(_seq), _Item(call, chat_id, priority, future)))
+    _wakeup.set()
+    return await future
+
+
+def outbox_stats() -> dict:
+    lags = sorted(_lags)
+    return {
+        **_stats,
+        "queued": len(_ready) + len(_waiting),
+        "in_flight": _in_flight,
+        "lag_p50": round(lags[len(lags) // 2], 2) if lags else 0.0,
+        "lag_max": round(lags[-1], 2) if lags else 0.0,
+    }
+
+
+def _take_token(now: float) -> float:
+    """Take one token of the global bucket; returns seconds to wait if empty"""
+    global _tokens, _tokens_at
+    rate = GLOBAL_RATE * _rate_share
+    _tokens = min(_burst(), _tokens + (now - _tokens_at) * rate)
+    _tokens_at = now
+    if _tokens < 1:
+        return (1 - _tokens) / rate
+    _tokens -= 1
+    return 0.0
+
+
+def _refund_token():
+    global _tokens
+    _tokens = min(_burst(), _tokens + 1)
+
+
+def _burst() -> float:
+    return max(1.0, GLOBAL_BURST * _rate_share)
+
+
+def _defer(item, not_before: float):
+    heapq.heappush(_waiting, (not_before, next(_seq), item))
+
+
+async def _deliver(item):
+    global _in_flight, _paused_until
+    try:
+        result = await item.call()
+    except TelegramRetryAfter as e:
+        item.attempts += 1
+        if item.attempts > MAX_RETRIES:
+            _stats["failed"] += 1
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        # A 429 usually means the whole bot is over the limit, so hold everything
+        logging.warning(f"Telegram flood control, pausing outbox for {e.retry_after}s")
+        _stats["retried"] += 1
+        _paused_until = max(_paused_until, time.monotonic() + e.retry_after)
+        _defer(item, _paused_until)
+    except Exception as e:
+        _stats["failed"] += 1
+        if not item.future.done():
+            item.future.set_exception(e)
+    else:
+        _stats["sent"] += 1
+        _lags.append(time.monotonic() - item.submitted)
+        if not item.future.done():
+            item.future.set_result(result)
+    finally:
+        _in_flight -= 1
+        _wakeup.set()
+
+
+async def run_outbox():
+    """Single loop that hands queued calls to Telegram within the rate limits"""
+    global _in_flight
+    last_report = time.monotonic()
+    reported_sent = 0
+
+    while True:
+        try:
+            now = time.monotonic()
+            if now - last_report >= STATS_INTERVAL:
+                if _stats["sent"] != reported_sent or _ready or _waiting:
+                    logging.info(f"Outbox stats: {outbox_stats()}")
+                last_report, reported_sent = now, _stats["sent"]
+
+            while _waiting and _waiting[0][0] <= now:
+                _, seq, item = heapq.heappop(_waiting)
+                heapq.heappush(_ready, (item.priority, seq, item))
+
+            delay = None
+            if now < _paused_until:
+                delay = _paused_until - now
+            elif not _ready:
+                delay = _waiting[0][0] - now if _waiting else STATS_INTERVAL
+            elif _in_flight >= MAX_IN_FLIGHT:
+                delay = STATS_INTERVAL  # woken up by _deliver
+            else:
+                delay = _take_token(now) or None
+
+            if delay is not None:
+                _wakeup.clear()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, seq, item = heapq.heappop(_ready)
+            if item.future.cancelled():
+                _refund_token()
+                continue
+            if item.chat_id is not None:
+                next_slot = _chat_next_slot.get(item.chat_id, 0.0)
+                if next_slot > now:
+                    _refund_token()
+                    _defer(item, next_slot)
+                    continue
+                _chat_next_slot[item.chat_id] = now + CHAT_INTERVAL
+
+            _in_flight += 1
+            asyncio.create_task(_deliver(item))
+
+            # Forget chats that have been quiet for a while
+            if len(_chat_next_slot) > 10000:
+                for chat_id in [c for c, t in _chat_next_slot.items() if t < now]:
+                    del _chat_next_slot[chat_id]
+
+        except asyncio.CancelledError:
+            logging.info("Outbox cancelled")
+            break
+        except Exception as e:
+            logging.error(f"Outbox error: {e}")
+            await asyncio.sleep(1)
+
@@ -0,0 +1,274 @@
+"""Local prayer time calculation.
+
+Port of the PrayTimes.org algorithm that api.aladhan.com is built on, set up
+like our Aladhan calls: method=2 (ISNA, Fajr/Isha at 15 degrees), school=1
+(Hanafi Asr, shadow factor 2) and Aladhan's default angle-based high latitude
+rule. Everything is vectorized with NumPy, so a whole year for thousands of
+coordinates is a single batch.
+"""
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+
+FAJR_ANGLE = 15.0
+ISHA_ANGLE = 15.0
+ASR_FACTOR = 2  # 1 = Shafi, 2 = Hanafi
+RISE_SET_ANGLE = 0.833  # sea level
+
+# Users are grouped into square cells of this many degrees and share the times
+# computed at the cell center. Half a cell of longitude is 6 seconds of solar
+# time, so a shared time is at most one minute off after rounding.
+CELL_SIZE = 0.05
+
+# Aladhan-style names of the returned timings
+TIMINGS = ("Fajr", "Sunrise", "Dhuhr", "Asr", "Sunset", "Maghrib", "Isha")
+
+
+# ======================
+# DEGREE MATH
+# ======================
+def _dsin(d):
+    return np.sin(np.radians(d))
+
+def _dcos(d):
+    return np.cos(np.radians(d))
+
+def _dtan(d):
+    return np.tan(np.radians(d))
+
+def _darcsin(x):
+    return np.degrees(np.arcsin(x))
+
+def _darccos(x):
+    return np.degrees(np.arccos(x))
+
+def _darctan2(y, x):
+    return np.degrees(np.arctan2(y, x))
+
+def _darccot(x):
+    return np.degrees(np.arctan(1.0 / x))
+
+def _fix_angle(a):
+    return np.mod(a, 360.0)
+
+def _fix_hour(h):
+    return np.mod(h, 24.0)
+
+
+# ======================
+# ASTRONOMY
+# ======================
+def _julian(day: date) -> float:
+    year, month = day.year, day.month
+    if month <= 2:
+        year -= 1
+        month += 12
+    a = year // 100
+    b = 2 - a + a // 4
+    return int(365.25 * (year + 4716)) + int(30.6001 * (month + 1)) + day.day + b - 1524.5
+
+
+def _sun_position(jd):
+    """Return (declination, equation of time) for julian dates"""
+    d = jd - 2451545.0
+    g = _fix_angle(357.529 + 0.98560028 * d)
+    q = _fix_angle(280.459 + 0.98564736 * d)
+    l = _fix_angle(q + 1.915 * _dsin(g) + 0.020 * _dsin(2 * g))
+    e = 23.439 - 0.00000036 * d
+
+    ra = _darctan2(_dcos(e) * _dsin(l), _dcos(l)) / 15
+    eqt = q / 15 - _fix_hour(ra)
+    decl = _darcsin(_dsin(e) * _dsin(l))
+    return decl, eqt
+
+
+def _mid_day(jdate, portion):
+    _, eqt = _sun_position(jdate + portion)
+    return _fix_hour(12 - eqt)
+
+
+def _sun_angle_time(jdate, lat, angle, portion, ccw=False, sun=None):
+    decl, eqt = sun if sun is not None else _sun_position(jdate + portion)
+    noon = _fix_hour(12 - eqt)
+    t = _darccos(
+        (-_dsin(angle) - _dsin(decl) * _dsin(lat)) / (_dcos(decl) * _dcos(lat))
+    ) / 15
+    return noon - t if ccw else noon + t
+
+
+def _asr_time(jdate, lat, portion):
+    sun = _sun_position(jdate + portion)
+    angle = -_darccot(ASR_FACTOR + _dtan(np.abs(lat - sun[0])))
+    return _sun_angle_time(jdate, lat, angle, portion, sun=sun)
+
+
+def _adjust_high_lat(t, base, angle, night, ccw=False):
+    """Aladhan's default ANGLE_BASED rule for when twilight never ends"""
+    portion = angle / 60.0 * night
+    diff = _fix_hour(base - t) if ccw else _fix_hour(t - base)
+    bad = np.isnan(t) | (diff > portion)
+    return np.where(bad, base - portion if ccw else base + portion, t)
+
+
+def _utc_hours(lats, lons, days):
+    """Prayer times in UTC hours for each (coordinate, day), shape (N, D)"""
+    lat = lats[:, None]
+    lon = lons[:, None]
+    jdate = np.array([_julian(d) for d in days])[None, :] - lon / (15 * 24)
+
+    # Single iteration from the same initial guesses as PrayTimes
+    with np.errstate(invalid="ignore"):
+        fajr = _sun_angle_time(jdate, lat, FAJR_ANGLE, 5 / 24, ccw=True)
+        sunrise = _sun_angle_time(jdate, lat, RISE_SET_ANGLE, 6 / 24, ccw=True)
+        dhuhr = _mid_day(jdate, 12 / 24)
+        asr = _asr_time(jdate, lat, 13 / 24)
+        # Sunset and Isha start from the same guess, so share the sun position
+        evening = _sun_position(jdate + 18 / 24)
+        sunset = _sun_angle_time(jdate, lat, RISE_SET_ANGLE, 18 / 24, sun=evening)
+        isha = _sun_angle_time(jdate, lat, ISHA_ANGLE, 18 / 24, sun=evening)
+
+    shift = lon / 15
+    times = {
+        "Fajr": fajr - shift,
+        "Sunrise": sunrise - shift,
+        "Dhuhr": dhuhr - shift,
+        "Asr": asr - shift,
+        "Sunset": sunset - shift,
+        "Isha": isha - shift,
+    }
+
+    night = _fix_hour(times["Sunrise"] - times["Sunset"])
+    times["Fajr"] = _adjust_high_lat(times["Fajr"], times["Sunrise"], FAJR_ANGLE, night, ccw=True)
+    times["Isha"] = _adjust_high_lat(times["Isha"], times["Sunset"], ISHA_ANGLE, night)
+    times["Maghrib"] = times["Sunset"]  # ISNA: Maghrib is sunset + 0 min
+    return times
+
+
+def _utc_offsets(timezones, days):
+    """UTC offset in hours of each timezone on each day (at local noon), shape (N, D)"""
+    offsets = {}
+    for name in set(timezones):
+        tz = ZoneInfo(name)
+        offsets[name] = [
+            datetime(d.year, d.month, d.day, 12, tzinfo=tz).utcoffset().total_seconds() / 3600
+            for d in days
+        ]
+    return np.array([offsets[name] for name in timezones])
+
+
+# ======================
+# PUBLIC API
+# ======================
+def compute_times(lats, lons, timezones, days):
+    """Batch prayer times.
+
+    lats, lons and timezones (IANA names) describe N locations, days is a list
+    of D dates. Returns {timing name: int array (N, D)} of minutes after local
+    midnight, rounded like Aladhan, with -1 where the sun never gets there.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    days = list(days)
+
+    utc = _utc_hours(lats, lons, days)
+    offsets = _utc_offsets(list(timezones), days)
+
+    result = {}
+    for name in TIMINGS:
+        local = _fix_hour(utc[name] + offsets)
+        minutes = np.floor(local * 60 + 0.5)
+        result[name] = np.where(np.isnan(minutes), -1, np.mod(minutes, 1440)).astype(int)
+    return result
+
+
+def year_days(year: int):
+    day = date(year, 1, 1)
+    days = []
+    while day.year == year:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def format_minutes(minutes: int) -> str | None:
+    if minutes < 0:
+        return None
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def calc_prayer_times(lat: float, lon: float, timezone: str, day: date | None = None):
+    """Prayer times of one location in the same shape as Aladhan's `timings`"""
+    if day is None:
+        day = datetime.now(ZoneInfo(timezone)).date()
+    times = compute_times([lat], [lon], [timezone], [day])
+    return {name: format_minutes(int(times[name][0, 0])) for name in TIMINGS}
+
+
+def calc_prayer_times_batch(lats, lons, timezones):
+    """Today's prayer times for many locations, each for its own local date"""
+    today = datetime.now(dt_timezone.utc).date()
+    days = [today - timedelta(days=1), today, today + timedelta(days=1)]
+    times = compute_times(lats, lons, timezones, days)
+
+    local_today = {name: datetime.now(ZoneInfo(name)).date() for name in set(timezones)}
+    result = []
+    for i, name in enumerate(timezones):
+        col = (local_today[name] - days[0]).days
+        result.append({timing: format_minutes(int(times[timing][i, col])) for timing in TIMINGS})
+    return result
+
+
+def cell_of(lat: float, lon: float):
+    return (round(lat / CELL_SIZE), round(lon / CELL_SIZE))
+
+
+def cell_center(cell):
+    return cell[0] * CELL_SIZE, cell[1] * CELL_SIZE
+
+
+def group_by_cell(users, timezone_of) -> dict:
+    """{(cell, timezone): users} of {"id", "lat", "lon", "timezone"} dicts.
+
+    Cells near a border can hold users of two timezones, so the user's own
+    timezone is part of the key; timezone_of(lat, lon) is only called for
+    users without one.
+    """
+    cells = {}
+    for user in users:
+        tz = user.get("timezone") or timezone_of(user["lat"], user["lon"])
+        cells.setdefault((cell_of(user["lat"], user["lon"]), tz), []).append(user)
+    return cells
+
+
+def spread_over_cells(cells: dict, timings_per_cell):
+    """({user_id: timings}, {user_id: timezone}) from one timings per cell; None skips a cell"""
+    times = {}
+    user_timezones = {}
+    for ((_, tz), cell_users), timings in zip(cells.items(), timings_per_cell):
+        if timings is None:
+            continue
+        for user in cell_users:
+            times[user["id"]] = timings
+            user_timezones[user["id"]] = tz
+    return times, user_timezones
+
+
+def calc_prayer_times_by_cell(users, timezone_of):
+    """Today's prayer times for users, computed once per (cell, timezone).
+
+    See group_by_cell for users and timezone_of.
+    Returns ({user_id: timings}, {user_id: timezone}, number of computed cells).
+    """
+    if not users:
+        return {}, {}, 0
+
+    cells = group_by_cell(users, timezone_of)
+    centers = [cell_center(cell) for cell, _ in cells]
+    batch = calc_prayer_times_batch(
+        [lat for lat, _ in centers],
+        [lon for _, lon in centers],
+        [tz for _, tz in cells],
+    )
+    return *spread_over_cells(cells, batch), len(cells)
@@ -1,28 +1,80 @@
-import requests
+import asyncio
+import logging
+import os
+
+from backend.Database.database import get_timezone_from_latlon
+from backend.Database.async_db import run_db
+from backend.Telegram_handler.prayer_calc import (
+    calc_prayer_times, calc_prayer_times_by_cell, cell_center, group_by_cell, spread_over_cells,
+)
+from backend.Telegram_handler.http_client import get_json
+from backend.Telegram_handler import geocode_cache
+
+# Where users' prayer times come from: "aladhan" (api.aladhan.com) or "local"
+# (prayer_calc.py). Aladhan until the local engine passes the golden test
+# against recorded Aladhan timings (tests/test_prayer_calc.py)
+PRAYER_TIMES_SOURCE = os.getenv("PRAYER_TIMES_SOURCE", "aladhan")
 
 # Gets the cordinates of the city 
-def get_cor_city(city):
-    url = f"https://nominatim.openstreetmap.org/search?city={city}&format=json"
-    response = requests.get(url,headers = {"User-Agent": "Mozilla/5.0 (TelegramBot)"})  
-    data = response.json()
+# Known names (and known misses) are answered from the local geocode cache,
+# whose SQLite reads and writes run on the db pool, off the event loop
+async def get_cor_city(city):
+    found, cors = await run_db(geocode_cache.lookup, city)
+    if found:
+        return cors
+
+    data = await get_json(
+        "https://nominatim.openstreetmap.org/search",
+        params={"city": city, "format": "json"},
+    )
     if not data:
+        await run_db(geocode_cache.store, city, None)
         return None
     lat = data[0]["lat"]
     lon = data[0]["lon"]
+    await run_db(geocode_cache.store, city, (lat, lon))
     return lat, lon
 
 # Gets the prayer times for the specific cordinates
-def get_by_cor(lat,lon):
+# The local engine uses the same settings as the Aladhan call below (ISNA, Hanafi)
+async def get_by_cor(lat, lon, timezone=None):
+  if PRAYER_TIMES_SOURCE != "local":
+    return await get_by_cor_aladhan(lat, lon, timezone=timezone)
+  if timezone is None:
+    timezone = await run_db(get_timezone_from_latlon, float(lat), float(lon))
+  return await run_db(calc_prayer_times, float(lat), float(lon), timezone)
+
+# Same timings from api.aladhan.com, the reference the local calculation is
+# tested against (tests/record_aladhan.py records them for tests/test_prayer_calc.py)
+async def get_by_cor_aladhan(lat, lon, day=None, timezone=None):
   madhab = 1 #  1 = Hanafi 
-  url = f"https://api.aladhan.com/v1/timings?latitude={lat}&longitude={lon}&method=2&school={madhab}"
-  response = requests.get(url)
-  response.raise_for_status()
-  data = response.json()
+  url = "https://api.aladhan.com/v1/timings"
+  if day is not None:
+    url += f"/{day.strftime('%d-%m-%Y')}"
+  params = {"latitude": lat, "longitude": lon, "method": 2, "school": madhab}
+  if timezone is not None:
+    params["timezonestring"] = timezone
+  data = await get_json(url, params=params)
   if not data:
         return None
   return (data['data']['timings'])
 
 
+# Today's prayer times of many users, fetched or computed once per geo cell
+# Returns ({user_id: timings}, {user_id: timezone}, number of cells) like calc_prayer_times_by_cell
+async def get_by_cell(users):
+  if PRAYER_TIMES_SOURCE == "local":
+    return await run_db(calc_prayer_times_by_cell, users, get_timezone_from_latlon)
+
+  cells = await run_db(group_by_cell, users, get_timezone_from_latlon)
 
+  async def fetch(cell, timezone):
+    lat, lon = cell_center(cell)
+    try:
+      return await get_by_cor_aladhan(lat, lon, timezone=timezone)
+    except Exception as e:
+      logging.error(f"Aladhan lookup failed for cell {cell} ({timezone}): {e}")
+      return None
 
-    
+  timings = await asyncio.gather(*(fetch(cell, timezone) for cell, timezone in cells))
+  return *spread_over_cells(cells, timings), len(cells)
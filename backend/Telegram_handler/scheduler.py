@@ -0,0 +1,146 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta, time, timezone
+
+from backend.Database.prayer_times_cache import CachedPrayerTimes, get_cached_prayer_times
+
+
+# ======================
+# EVENT KINDS
+# ======================
+PRAYER = "prayer"                # "Time for X" at the prayer start
+PRE_PRAYER = "pre_prayer"        # 10 minutes before the prayer deadline
+ISHA_REMINDER = "isha_reminder"  # fixed 22:00 Isha reminder
+ROLLOVER = "rollover"            # local midnight, plan the next day
+
+PRE_PRAYER_MINUTES = 10
+ISHA_REMINDER_TIME = time(22, 0)
+FIRE_GRACE = timedelta(minutes=1)  # an event is still sent if we are late by less than this
+
+# Sunrise is the deadline for Fajr
+# Asr is the deadline for Dhuhr
+# Maghrib is the deadline for Asr
+# Isha is the deadline for Maghrib
+DEADLINE_TO_PRAYER = {
+    "sunrise": "fajr",
+    "dhuhr": None,
+    "asr": "dhuhr",
+    "maghrib": "asr",
+    "isha": "maghrib",
+}
+
+# ======================
+# GLOBALS
+# ======================
+# Heap of (fire_at, seq, user_id, generation, kind, prayer).
+# fire_at is an aware datetime in the user's timezone, so entries of
+# different users still compare correctly.
+event_heap = []
+# Rescheduling a user bumps its generation; older heap entries are dropped lazily
+user_generation = {}
+_seq = itertools.count()
+_wakeup = asyncio.Event()
+
+
+def plan_day(prayer_times: CachedPrayerTimes, day):
+    """Return (fire_at, kind, prayer) events of one local day, sorted by time"""
+    tz = prayer_times.tz
+    events = []
+
+    for prayer, t in prayer_times.times.items():
+        dt = datetime.combine(day, t, tzinfo=tz)
+        events.append((dt, PRAYER, prayer))
+
+        target_prayer = DEADLINE_TO_PRAYER.get(prayer)
+        if target_prayer is not None:
+            events.append((dt - timedelta(minutes=PRE_PRAYER_MINUTES), PRE_PRAYER, target_prayer))
+
+    events.append((datetime.combine(day, ISHA_REMINDER_TIME, tzinfo=tz), ISHA_REMINDER, "isha"))
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def _push(fire_at, user_id, generation, kind, prayer):
+    heapq.heappush(event_heap, (fire_at, next(_seq), user_id, generation, kind, prayer))
+
+
+def schedule_user(user_id: int, day=None):
+    """(Re)plan all events of a user for its current local day.
+
+    Any events planned earlier for this user are invalidated. Prayer times come
+    from the in-process cache, so replanning normally needs no database read.
+    """
+    prayer_times = get_cached_prayer_times(user_id)
+
+    generation = user_generation.get(user_id, 0) + 1
+    user_generation[user_id] = generation
+
+    tz = prayer_times.tz
+    now = datetime.now(tz)
+    if day is None:
+        day = now.date()
+
+    for fire_at, kind, prayer in plan_day(prayer_times, day):
+        if now < fire_at + FIRE_GRACE:
+            _push(fire_at, user_id, generation, kind, prayer)
+
+    # Plan the next day shortly after local midnight
+    next_midnight = datetime.combine(day + timedelta(days=1), time(0, 0), tzinfo=tz)
+    _push(next_midnight + timedelta(seconds=5), user_id, generation, ROLLOVER, None)
+
+    _wakeup.set()
+
+
+def _rollover(user_id: int):
+    try:
+        schedule_user(user_id)
+    except Exception as e:
+        logging.error(f"Failed to plan next day for user {user_id}: {e}")
+        # Try again later instead of dropping the user from the scheduler
+        generation = user_generation.get(user_id, 0)
+        _push(datetime.now(timezone.utc) + timedelta(minutes=10), user_id, generation, ROLLOVER, None)
+
+
+async def run_scheduler(handler):
+    """Single loop that sleeps until the earliest due event.
+
+    handler(user_id, kind, prayer, fire_at) is awaited in its own task for every
+    due event, so a slow send never delays other users.
+    """
+    while True:
+        try:
+            if not event_heap:
+                await _wakeup.wait()
+                _wakeup.clear()
+                continue
+
+            now = datetime.now(timezone.utc)
+            delay = (event_heap[0][0] - now).total_seconds()
+            if delay > 0:
+                _wakeup.clear()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            while event_heap and event_heap[0][0] <= now:
+                fire_at, _, user_id, generation, kind, prayer = heapq.heappop(event_heap)
+                if user_generation.get(user_id) != generation:
+                    continue  # stale, the user was rescheduled
+                if kind == ROLLOVER:
+                    _rollover(user_id)
+                    continue
+                if now >= fire_at + FIRE_GRACE:
+                    logging.warning(f"Skipping late {kind} event for user {user_id} ({prayer})")
+                    continue
+                asyncio.create_task(handler(user_id, kind, prayer, fire_at))
+
+        except asyncio.CancelledError:
+            logging.info("Prayer scheduler cancelled")
+            break
+        except Exception as e:
+            logging.error(f"Prayer scheduler error: {e}")
+            await asyncio.sleep(1)
@@ -0,0 +1,44 @@
+import os
+
+
+# ======================
+# SETTINGS
+# ======================
+SHARDS = int(os.getenv("BOT_SHARDS", "1"))
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach).
+
+    Going from N to N+1 buckets moves only about 1/(N+1) of the keys, and
+    only into the new bucket, so a resize keeps most users on their worker.
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def shard_of(user_id: int, shards: int = None) -> int:
+    return jump_hash(user_id, shards or SHARDS)
+
+
+def update_user_id(update: dict):
+    """Telegram user (or chat) id an update belongs to, from its raw JSON.
+
+    Every update type carries its sender as "from" (or "user" for a few
+    member/poll updates); None if it has neither.
+    """
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+        chat = value.get("chat")
+        if chat:
+            return chat["id"]
+    return None
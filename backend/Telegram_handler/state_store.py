@@ -0,0 +1,192 @@
+"""Bot state that has to survive a restart.
+
+The dicts in tg_bot.py stay the source of truth while the bot runs; every
+change is also queued here and written to SQLite in one transaction every
+FLUSH_INTERVAL seconds (write-behind), so sending a message never waits on disk.
+On startup load() returns everything in a single pass.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+from backend.Database.async_db import run_db
+
+
+# ======================
+# SETTINGS
+# ======================
+STATE_PATH = os.getenv("BOT_STATE_PATH", "bot_state.sqlite3")
+FLUSH_INTERVAL = 2   # seconds
+SENT_KEEP_DAYS = 2   # dedupe keys older than this are dropped
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent (       -- dedupe keys of sent notifications
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,                 -- 'prayer' or 'pre'
+    name TEXT NOT NULL,                 -- prayer, or 'isha_daily'
+    day TEXT NOT NULL,                  -- ISO date
+    PRIMARY KEY (user_id, kind, name, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS notification (   -- last "Time for X" message
+    user_id INTEGER PRIMARY KEY,
+    message_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reminder (   -- reminders waiting for ✅/❌
+    user_id INTEGER NOT NULL,
+    prayer TEXT NOT NULL,
+    day TEXT NOT NULL,                  -- ISO date
+    message_id INTEGER NOT NULL,
+    deadline REAL NOT NULL,             -- unix time of the auto-qaza
+    PRIMARY KEY (user_id, prayer, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS media (      -- Telegram file_ids of sent GIFs, see media.py
+    url TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL
+);
+"""
+
+# ======================
+# GLOBALS
+# ======================
+# (table, key) -> (sql, params); a later change of the same row replaces the earlier one
+_pending = {}
+_lock = threading.Lock()        # guards _pending
+_write_lock = threading.Lock()  # guards the connection
+_db = None
+_pruned_on = None
+
+
+def _connection():
+    global _db
+    if _db is None:
+        _db = sqlite3.connect(STATE_PATH, check_same_thread=False, timeout=10)
+        # Sharded workers share the file, see bot_cluster.py
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.executescript(SCHEMA)
+        _db.commit()
+    return _db
+
+
+def _queue(table, key, sql, params):
+    with _lock:
+        _pending[(table, key)] = (sql, params)
+
+
+# ======================
+# CHANGES
+# ======================
+def mark_sent(user_id: int, kind: str, name: str, day: date):
+    _queue(
+        "sent", (user_id, kind, name, day),
+        "INSERT OR IGNORE INTO sent (user_id, kind, name, day) VALUES (?, ?, ?, ?)",
+        (user_id, kind, name, day.isoformat()),
+    )
+
+
+def set_notification(user_id: int, message_id: int):
+    _queue(
+        "notification", user_id,
+        "INSERT OR REPLACE INTO notification (user_id, message_id) VALUES (?, ?)",
+        (user_id, message_id),
+    )
+
+
+def add_reminder(user_id: int, prayer: str, day: date, message_id: int, deadline: float):
+    _queue(
+        "reminder", (user_id, prayer, day),
+        "INSERT OR REPLACE INTO reminder (user_id, prayer, day, message_id, deadline) VALUES (?, ?, ?, ?, ?)",
+        (user_id, prayer, day.isoformat(), message_id, deadline),
+    )
+
+
+def remove_reminder(user_id: int, prayer: str, day: date):
+    _queue(
+        "reminder", (user_id, prayer, day),
+        "DELETE FROM reminder WHERE user_id = ? AND prayer = ? AND day = ?",
+        (user_id, prayer, day.isoformat()),
+    )
+
+
+def set_media(url: str, file_id: str):
+    _queue(
+        "media", url,
+        "INSERT OR REPLACE INTO media (url, file_id) VALUES (?, ?)",
+        (url, file_id),
+    )
+
+
+def forget_media(url: str):
+    _queue("media", url, "DELETE FROM media WHERE url = ?", (url,))
+
+
+# ======================
+# FLUSH / LOAD
+# ======================
+def flush() -> int:
+    """Write all queued changes in one transaction; returns how many"""
+    global _pruned_on
+    today = date.today()
+    with _write_lock:
+        with _lock:
+            items = list(_pending.items())
+            _pending.clear()
+
+        db = _connection()
+        try:
+            with db:
+                for sql, params in (op for _, op in items):
+                    db.execute(sql, params)
+                if _pruned_on != today:
+                    cutoff = today - timedelta(days=SENT_KEEP_DAYS)
+                    db.execute("DELETE FROM sent WHERE day < ?", (cutoff.isoformat(),))
+                    _pruned_on = today
+        except Exception:
+            # Retry with the next flush, unless the row was changed again meanwhile
+            with _lock:
+                for key, op in items:
+                    _pending.setdefault(key, op)
+            raise
+    return len(items)
+
+
+def load() -> dict:
+    """Everything needed to resume after a restart, in one read.
+
+    Returns {"sent": [(user_id, kind, name, date)], "notification": {user_id: message_id},
+    "reminder": [(user_id, prayer, date, message_id, deadline)], "media": {url: file_id}}.
+    """
+    cutoff = (date.today() - timedelta(days=SENT_KEEP_DAYS)).isoformat()
+    with _write_lock:
+        db = _connection()
+        sent = [
+            (user_id, kind, name, date.fromisoformat(day))
+            for user_id, kind, name, day in db.execute(
+                "SELECT user_id, kind, name, day FROM sent WHERE day >= ?", (cutoff,)
+            )
+        ]
+        notification = dict(db.execute("SELECT user_id, message_id FROM notification"))
+        reminder = [
+            (user_id, prayer, date.fromisoformat(day), message_id, deadline)
+            for user_id, prayer, day, message_id, deadline in db.execute(
+                "SELECT user_id, prayer, day, message_id, deadline FROM reminder"
+            )
+        ]
+        media = dict(db.execute("SELECT url, file_id FROM media"))
+
+    return {"sent": sent, "notification": notification, "reminder": reminder, "media": media}
+
+
+async def run_flusher():
+    """Background task writing queued changes every FLUSH_INTERVAL seconds"""
+    while True:
+        try:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await run_db(flush)
+        except asyncio.CancelledError:
+            await run_db(flush)
+            break
+        except Exception as e:
+            logging.error(f"Failed to save bot state: {e}")
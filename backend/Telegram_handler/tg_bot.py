@@ -3,15 +3,19 @@ import sys
 import os
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
+import time
+from functools import partial
+from datetime import date, datetime, timedelta
 
 from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher, F, html
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import (
     Message,
     KeyboardButton,
@@ -27,16 +31,31 @@ from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from backend.Telegram_handler.prayer_times import get_by_cor, get_cor_city
-from backend.Database.qaza_stats import get_prayer_times, get_all_users, get_prayer_message, get_gif
+from backend.Telegram_handler.prayer_times import get_by_cell, get_by_cor, get_cor_city
+from backend.Telegram_handler.http_client import close_session
+from backend.Telegram_handler import media, outbox, state_store
+from backend.Telegram_handler.sharding import shard_of
+from backend.Telegram_handler.scheduler import (
+    PRAYER,
+    PRE_PRAYER,
+    ISHA_REMINDER,
+    schedule_user,
+    run_scheduler
+)
+from backend.Database.qaza_stats import PAGE_SIZE, get_page, get_all_user_locations
+from backend.Database.content_store import load_content, get_prayer_message, get_gif
+from backend.Database.async_db import run_db
+from backend.Database.prayer_times_cache import put_prayer_times, prayer_times_cache_stats
 from backend.Database.database import (
     insert_user,
     update_user,
     is_user_exist,
     insert_prayer_times,
     update_prayer_times,
+    upsert_prayer_times_bulk,
     add_qaza,
-    add_prayer
+    add_prayer,
+    reconcile_qaza_counters
 )
 
 
@@ -45,6 +64,7 @@ from backend.Database.database import (
 # ======================
 load_dotenv()
 access_token = os.getenv("TELEGRAM_TOKEN")
+api_url = os.getenv("TELEGRAM_API_URL")  # self-hosted Bot API server, default api.telegram.org
 
 # ======================
 # FSM STATES
@@ -62,77 +82,116 @@ dp = Dispatcher(storage=MemoryStorage())
 # GLOBALS
 # ======================
 sent_today = {}  # prevent duplicates
-prayer_scheduler_tasks = {}  # per-user prayer scheduler
-pre_prayer_scheduler_tasks = {}  # per-user pre-prayer scheduler
-last_warned_prayer = {}  # Fixed: Now stores message_id to track which prayer was warned
+sent_pre = {}  # per-user sent pre-prayer reminders, keyed by (prayer, date)
+pending_reminders = {}  # user_id -> {(prayer, date): message_id} of reminders waiting for ✅/❌
 last_prayer_notification = {}  #Track last prayer time notification message
 
+MAX_PENDING_PER_USER = 6  # a day has 5 reminders; anything older has expired already
+
+# Which users this process serves; see bot_cluster.py for the sharded mode
+SHARD_INDEX = 0
+SHARD_COUNT = 1
+
+
+def configure_shard(index: int, count: int):
+    global SHARD_INDEX, SHARD_COUNT
+    SHARD_INDEX, SHARD_COUNT = index, count
+    # The Telegram rate limit is per bot, so the shards split it
+    outbox.set_rate_share(1 / count)
+
+
+def owns_user(user_id: int) -> bool:
+    return SHARD_COUNT == 1 or shard_of(user_id, SHARD_COUNT) == SHARD_INDEX
+
 
 # ======================
 # INLINE BUTTONS (10-MIN WARNING)
 # ======================
-prayed_keyboard = InlineKeyboardMarkup(
-    inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅", callback_data="prayed_yes"),
-            InlineKeyboardButton(text="❌", callback_data="prayed_no"),
+class PrayedCallback(CallbackData, prefix="prayed"):
+    answer: str  # "yes" / "no"
+    prayer: str
+    day: str  # ISO date of the reminder
+
+
+def prayed_keyboard(prayer: str, day: date) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="✅",
+                    callback_data=PrayedCallback(answer="yes", prayer=prayer, day=day.isoformat()).pack()
+                ),
+                InlineKeyboardButton(
+                    text="❌",
+                    callback_data=PrayedCallback(answer="no", prayer=prayer, day=day.isoformat()).pack()
+                ),
+            ]
         ]
-    ]
-)
+    )
+
 
 # ======================
-# PRAYER SCHEDULER
+# PENDING REMINDERS
 # ======================
-async def prayer_scheduler(bot: Bot, user_id: int):
-    while True:
-        try:
-            prayer_times = get_prayer_times(user_id)
-            tz = ZoneInfo(prayer_times["timezone"])
-            now = datetime.now(tz).strftime("%H:%M")
-            today = datetime.now(tz).date()
+def add_pending_reminder(user_id: int, prayer: str, day: date, message_id: int):
+    user_pending = pending_reminders.setdefault(user_id, {})
+    user_pending[(prayer, day)] = message_id
+    while len(user_pending) > MAX_PENDING_PER_USER:
+        oldest = next(iter(user_pending))  # dicts keep insertion order
+        del user_pending[oldest]
+        state_store.remove_reminder(user_id, *oldest)
 
-            if user_id not in sent_today:
-                sent_today[user_id] = {}
 
-            for prayer, time_str in prayer_times.items():
-                if prayer == "timezone":
-                    continue
-                if now == time_str:
-                    if sent_today[user_id].get(prayer) == today:
-                        continue
-                    
-                    # DELETE PREVIOUS PRAYER NOTIFICATION
-                    if user_id in last_prayer_notification:
-                        try:
-                            await bot.delete_message(chat_id=user_id, message_id=last_prayer_notification[user_id])
-                        except Exception as e:
-                            logging.error(f"Failed to delete previous prayer notification: {e}")
-                    
-                    # SEND NEW NOTIFICATION AND STORE MESSAGE ID
-                    sent_message = await bot.send_message(
-                        chat_id=user_id,
-                        text=f"🕌 Time for {prayer.capitalize()}\n{get_prayer_message(prayer)}\n({time_str})",
-                    )
-                    last_prayer_notification[user_id] = sent_message.message_id
-                    sent_today[user_id][prayer] = today
-                        
-            await asyncio.sleep(30)
-            
-        except asyncio.CancelledError:
-            # Task was cancelled, exit gracefully
-            logging.info(f"Prayer scheduler cancelled for user {user_id}")
-            break
-        except Exception as e:
-            logging.error(f"Prayer scheduler error for user {user_id}: {e}")
-            await asyncio.sleep(60)  # Back off on error
+def pop_pending_reminder(user_id: int, prayer: str, day: date, message_id: int = None):
+    """Resolve a reminder; returns its message_id, or None if it was already answered or expired"""
+    user_pending = pending_reminders.get(user_id)
+    if not user_pending:
+        return None
+    found = user_pending.get((prayer, day))
+    if found is None or (message_id is not None and found != message_id):
+        return None
 
-def start_prayer_scheduler(bot: Bot, user_id: int):
-    # Cancel existing task if any
-    if user_id in prayer_scheduler_tasks:
-        prayer_scheduler_tasks[user_id].cancel()
-    
-    task = asyncio.create_task(prayer_scheduler(bot, user_id))
-    prayer_scheduler_tasks[user_id] = task
+    del user_pending[(prayer, day)]
+    if not user_pending:
+        del pending_reminders[user_id]
+    state_store.remove_reminder(user_id, prayer, day)
+    return found
+
+# ======================
+# PRAYER TIME NOTIFICATION
+# ======================
+async def send_prayer_notification(bot: Bot, user_id: int, prayer: str, fire_at: datetime):
+    today = fire_at.date()
+
+    if user_id not in sent_today:
+        sent_today[user_id] = {}
+    if sent_today[user_id].get(prayer) == today:
+        return
+
+    # DELETE PREVIOUS PRAYER NOTIFICATION
+    if user_id in last_prayer_notification:
+        try:
+            await outbox.submit(
+                partial(bot.delete_message, chat_id=user_id, message_id=last_prayer_notification[user_id])
+            )
+        except Exception as e:
+            logging.error(f"Failed to delete previous prayer notification: {e}")
+
+    # SEND NEW NOTIFICATION AND STORE MESSAGE ID
+    prayer_message = await run_db(get_prayer_message, prayer)
+    sent_message = await outbox.submit(
+        partial(
+            bot.send_message,
+            chat_id=user_id,
+            text=f"🕌 Time for {prayer.capitalize()}\n{prayer_message}\n({fire_at.strftime('%H:%M')})",
+        ),
+        chat_id=user_id,
+        priority=outbox.NORMAL,
+    )
+    last_prayer_notification[user_id] = sent_message.message_id
+    sent_today[user_id][prayer] = today
+    state_store.set_notification(user_id, sent_message.message_id)
+    state_store.mark_sent(user_id, "prayer", prayer, today)
 
 
 # ======================
@@ -142,7 +201,10 @@ async def delete_message_after(bot: Bot, chat_id: int, message_id: int, seconds:
     """Delete a message after specified seconds"""
     await asyncio.sleep(seconds)
     try:
-        await bot.delete_message(chat_id=chat_id, message_id=message_id)
+        await outbox.submit(
+            partial(bot.delete_message, chat_id=chat_id, message_id=message_id),
+            priority=outbox.LOW,
+        )
     except Exception as e:
         # Message might already be deleted or user deleted it
         logging.error(f"Failed to delete message {message_id}: {e}")
@@ -150,163 +212,170 @@ async def delete_message_after(bot: Bot, chat_id: int, message_id: int, seconds:
 # ======================
 # MARK THE PRAYER AS QAZA AND DELETE THE MESSAGE 
 # ======================
-async def auto_mark_qaza_and_delete(bot: Bot, user_id: int, prayer_name: str, message_id: int, seconds: int):
+async def auto_mark_qaza_and_delete(bot: Bot, user_id: int, prayer_name: str, day: date, message_id: int, seconds: int):
     """Wait for timeout, then mark as qaza and delete message if user didn't respond"""
     await asyncio.sleep(seconds)
     
-    # Check if user already responded
-    prayer_data = last_warned_prayer.get(user_id)
-    if prayer_data and prayer_data.get('message_id') == message_id:
-        # User didn't respond, mark as qaza
-        add_qaza(prayer_name, user_id, reason="No response to reminder")
-        
-        # Clean up tracking
-        del last_warned_prayer[user_id]
+    # Still pending means the user didn't respond, mark as qaza
+    if pop_pending_reminder(user_id, prayer_name, day, message_id) is not None:
+        await run_db(add_qaza, prayer_name, user_id, reason="No response to reminder", day=day)
     
     # Delete the message regardless
     try:
-        await bot.delete_message(chat_id=user_id, message_id=message_id)
+        await outbox.submit(
+            partial(bot.delete_message, chat_id=user_id, message_id=message_id),
+            priority=outbox.LOW,
+        )
     except Exception as e:
         logging.error(f"Failed to delete message {message_id}: {e}")
              
 # ======================
 # PRE-PRAYER REMINDER (10 MIN)
 # ======================
-async def pre_prayer_scheduler(bot: Bot, user_id: int):
-    sent_pre = {}  # Fixed: Changed to dict to store dates for cleanup
-    
-    while True:
-        try:
-            prayer_times = get_prayer_times(user_id)
-            tz = ZoneInfo(prayer_times["timezone"])
-            now = datetime.now(tz)
+async def send_pre_prayer_warning(bot: Bot, user_id: int, target_prayer: str, caption: str, key):
+    day = key[1]
+    if user_id not in sent_pre:
+        sent_pre[user_id] = {}
+    if key in sent_pre[user_id]:
+        return
 
-            prayers = []
-            for prayer, time_str in prayer_times.items():
-                if prayer == "timezone": 
-                    continue
-                dt = datetime.strptime(time_str, "%H:%M").replace(
-                    year=now.year, month=now.month, day=now.day, tzinfo=tz
-                )
-                prayers.append((prayer, dt))
-            prayers.sort(key=lambda x: x[1])
-
-            # Sunrise is the deadline for Fajr
-            # Asr is the deadline for Dhuhr
-            # Maghrib is the deadline for Asr
-            deadline_to_prayer = {
-                "sunrise": "fajr",
-                "dhuhr": None,
-                "asr": "dhuhr",
-                "maghrib": "asr",
-                "isha": "maghrib",
-            }
-
-            for prayer, dt in prayers:
-                target_prayer = deadline_to_prayer.get(prayer)
-
-                if target_prayer is None:
-                    continue
+    # Send the reminder, ahead of "Time for X" messages queued at the same moment
+    sent_message = await media.send_animation(
+        await run_db(get_gif, 'judging'),
+        lambda animation: outbox.submit(
+            partial(
+                bot.send_animation,
+                chat_id=user_id,
+                animation=animation,
+                caption=caption,
+                reply_markup=prayed_keyboard(target_prayer, day)
+            ),
+            chat_id=user_id,
+            priority=outbox.URGENT,
+        ),
+    )
+    sent_pre[user_id][key] = True
+    state_store.mark_sent(user_id, "pre", key[0], key[1])
 
-                reminder_dt = dt - timedelta(minutes=10)
-                key = (target_prayer, reminder_dt.date())
-
-                if reminder_dt <= now < reminder_dt + timedelta(minutes=1):
-                    if key not in sent_pre:
-                        # Send the reminder
-                        sent_message = await bot.send_animation(
-                            chat_id=user_id,
-                            animation=get_gif(type='judging'),
-                            caption=f"⚠️ {target_prayer.capitalize()} prayer will be MISSED in 10 minutes.\nHave you prayed it already?",
-                            reply_markup=prayed_keyboard
-                        )
-                        sent_pre[key] = True
-                        
-                        # Fixed: Store both prayer name and message_id to track which prayer this reminder is for
-                        last_warned_prayer[user_id] = {
-                            'prayer': target_prayer,
-                            'message_id': sent_message.message_id
-                        }
-                        
-                        # Auto-timeout after 2 hours (7200 seconds)
-                        asyncio.create_task(
-                            auto_mark_qaza_and_delete(bot, user_id, target_prayer, sent_message.message_id, 7200)
-                        )
+    # Fixed: Clean up old dates from sent_pre to prevent memory leak
+    sent_pre[user_id] = {k: v for k, v in sent_pre[user_id].items()
+                         if k[1] >= key[1] - timedelta(days=1)}
 
+    # Every (prayer, day) reminder stays answerable on its own until it times out
+    add_pending_reminder(user_id, target_prayer, day, sent_message.message_id)
+
+    # Auto-timeout after 2 hours (7200 seconds)
+    state_store.add_reminder(user_id, target_prayer, day, sent_message.message_id, time.time() + 7200)
+    asyncio.create_task(
+        auto_mark_qaza_and_delete(bot, user_id, target_prayer, day, sent_message.message_id, 7200)
+    )
+
+# ======================
+# SCHEDULED EVENT DISPATCH
+# ======================
+async def handle_scheduled_event(bot: Bot, user_id: int, kind: str, prayer: str, fire_at: datetime):
+    try:
+        if kind == PRAYER:
+            await send_prayer_notification(bot, user_id, prayer, fire_at)
+        elif kind == PRE_PRAYER:
+            await send_pre_prayer_warning(
+                bot, user_id, prayer,
+                f"⚠️ {prayer.capitalize()} prayer will be MISSED in 10 minutes.\nHave you prayed it already?",
+                (prayer, fire_at.date())
+            )
+        elif kind == ISHA_REMINDER:
             # SPECIAL HANDLING FOR ISHA AT 22:00
-            isha_reminder_time = datetime.strptime("22:00", "%H:%M").replace(
-                year=now.year, month=now.month, day=now.day, tzinfo=tz
+            await send_pre_prayer_warning(
+                bot, user_id, 'isha',
+                f"⚠️ Isha prayer will be MISSED soon.\nHave you prayed it already?",
+                ("isha_daily", fire_at.date())
             )
-            isha_key = ("isha_daily", isha_reminder_time.date())
-
-            if isha_reminder_time <= now < isha_reminder_time + timedelta(minutes=1):
-                if isha_key not in sent_pre:
-                    # Send Isha reminder at 22:00
-                    sent_message = await bot.send_animation(
-                        chat_id=user_id,
-                        animation=get_gif(type='judging'),
-                        caption=f"⚠️ Isha prayer will be MISSED soon.\nHave you prayed it already?",
-                        reply_markup=prayed_keyboard
-                    )
-                    sent_pre[isha_key] = True
-                    
-                    last_warned_prayer[user_id] = {
-                        'prayer': 'isha',
-                        'message_id': sent_message.message_id
-                    }
-                    
-                    # Auto-timeout after 2 hours (7200 seconds)
-                    asyncio.create_task(
-                        auto_mark_qaza_and_delete(bot, user_id, 'isha', sent_message.message_id, 7200)
-                    )
+    except Exception as e:
+        logging.error(f"Failed to send {kind} ({prayer}) to user {user_id}: {e}")
+
+def start_user_scheduler(user_id: int):
+    try:
+        schedule_user(user_id)
+    except Exception as e:
+        logging.error(f"Failed to schedule prayers for user {user_id}: {e}")
 
-            # Fixed: Clean up old dates from sent_pre to prevent memory leak
-            today = now.date()
-            sent_pre = {k: v for k, v in sent_pre.items() 
-                       if k[1] >= today - timedelta(days=1)}
 
-            await asyncio.sleep(20)
-            
-        except asyncio.CancelledError:
-            # Task was cancelled, exit gracefully
-            logging.info(f"Pre-prayer scheduler cancelled for user {user_id}")
-            break
+# ======================
+# STARTUP LOADER
+# ======================
+PRAYER_TIMES_COLUMNS = "user_id,fajr,sunrise,dhuhr,asr,maghrib,isha,timezone"
+STARTUP_BATCH = 200  # users planned per event loop turn
+
+async def load_schedules():
+    """Plan every user's day from bulk reads of prayer_times.
+
+    Each page warms the prayer times cache and its users are planned right
+    away, STARTUP_BATCH at a time, so updates are handled during the load.
+    """
+    started = time.monotonic()
+    after = None
+    pages = scheduled = 0
+
+    while True:
+        try:
+            page = await run_db(get_page, "prayer_times", PRAYER_TIMES_COLUMNS, "user_id", after)
         except Exception as e:
-            logging.error(f"Pre-prayer scheduler error for user {user_id}: {e}")
-            await asyncio.sleep(60)  # Back off on error
+            logging.error(f"Failed to load prayer times page after user {after}: {e}")
+            await asyncio.sleep(5)
+            continue
+        pages += 1
+
+        for i in range(0, len(page), STARTUP_BATCH):
+            for row in page[i:i + STARTUP_BATCH]:
+                user_id = row["user_id"]
+                if not owns_user(user_id):
+                    continue
+                try:
+                    # A user who re-registered during the load is already cached with newer times
+                    put_prayer_times(user_id, {k: v for k, v in row.items() if k != "user_id"}, replace=False)
+                except Exception as e:
+                    logging.error(f"Bad prayer times for user {user_id}: {e}")
+                    continue
+                start_user_scheduler(user_id)
+                scheduled += 1
+            await asyncio.sleep(0)
 
-def start_pre_prayer_scheduler(bot: Bot, user_id: int):
-    # Cancel existing task if any
-    if user_id in pre_prayer_scheduler_tasks:
-        pre_prayer_scheduler_tasks[user_id].cancel()
-    
-    task = asyncio.create_task(pre_prayer_scheduler(bot, user_id))
-    pre_prayer_scheduler_tasks[user_id] = task
+        if len(page) < PAGE_SIZE:
+            break
+        after = page[-1]["user_id"]
+
+    logging.info(
+        f"Schedulers ready for {scheduled} users in {time.monotonic() - started:.2f}s ({pages} pages)"
+    )
 
 
-        
-        
 # ======================
 # DAILY PRAYER TIMES UPDATER
 # ======================
 async def daily_prayer_times_updater():
     while True:
         try:
-            users = get_all_users()
-            for user in users:
-                try:
-                    prayer_times = get_by_cor(user["lat"], user["lon"])
-                    update_prayer_times(
-                        user["id"],
-                        prayer_times["Fajr"],
-                        prayer_times["Sunrise"],
-                        prayer_times["Dhuhr"],
-                        prayer_times["Asr"],
-                        prayer_times["Maghrib"],
-                        prayer_times["Isha"],
-                    )
-                except Exception as e:
-                    logging.error(f"Failed to update prayer times for user {user['id']}: {e}")
+            users = [user for user in await run_db(get_all_user_locations) if owns_user(user["id"])]
+            # Users of the same city share a cell, so work scales with distinct locations
+            times, timezones, cells = await get_by_cell(users)
+            rows = [
+                {
+                    "user_id": user_id,
+                    "fajr": prayer_times["Fajr"],
+                    "sunrise": prayer_times["Sunrise"],
+                    "dhuhr": prayer_times["Dhuhr"],
+                    "asr": prayer_times["Asr"],
+                    "maghrib": prayer_times["Maghrib"],
+                    "isha": prayer_times["Isha"],
+                    "timezone": timezones[user_id],
+                }
+                for user_id, prayer_times in times.items()
+            ]
+            written = await run_db(upsert_prayer_times_bulk, rows)
+            logging.info(f"Updated prayer times for {written}/{len(users)} users in {cells} cells")
+
+            logging.info(f"Prayer times cache: {prayer_times_cache_stats()}")
+            logging.info(f"GIF sends: {media.media_stats()}")
                     
             await asyncio.sleep(86400)  # 24 hours
             
@@ -314,6 +383,20 @@ async def daily_prayer_times_updater():
             logging.error(f"Daily prayer times updater error: {e}")
             await asyncio.sleep(3600)  # Retry in 1 hour on error
 
+# ======================
+# QAZA COUNTERS RECONCILER
+# ======================
+async def qaza_counters_reconciler():
+    while True:
+        try:
+            drifted = await run_db(reconcile_qaza_counters)
+            logging.info(f"Qaza counters reconciled, {len(drifted)} rows had drifted")
+            await asyncio.sleep(86400)  # 24 hours
+
+        except Exception as e:
+            logging.error(f"Qaza counters reconciler error: {e}")
+            await asyncio.sleep(3600)  # Retry in 1 hour on error
+
 # ======================
 # COMMAND /START
 # ======================
@@ -346,11 +429,12 @@ async def handle_location(message: Message, state: FSMContext):
     
     lat = message.location.latitude
     lon = message.location.longitude
-    prayer_times = get_by_cor(lat=lat, lon=lon)
+    prayer_times = await get_by_cor(lat=lat, lon=lon)
 
-    if not is_user_exist(user_id) and user_name:
-        insert_user(id=user_id, name=user_name, lat=lat, lon=lon)
-        insert_prayer_times(
+    if not await run_db(is_user_exist, user_id) and user_name:
+        await run_db(insert_user, id=user_id, name=user_name, lat=lat, lon=lon)
+        await run_db(
+            insert_prayer_times,
             user_id,
             prayer_times["Fajr"],
             prayer_times["Sunrise"],
@@ -360,8 +444,9 @@ async def handle_location(message: Message, state: FSMContext):
             prayer_times["Isha"],
         )
     else:
-        update_user(id=user_id, name=user_name, lat=lat, lon=lon)
-        update_prayer_times(
+        await run_db(update_user, id=user_id, name=user_name, lat=lat, lon=lon)
+        await run_db(
+            update_prayer_times,
             user_id,
             prayer_times["Fajr"],
             prayer_times["Sunrise"],
@@ -382,9 +467,8 @@ async def handle_location(message: Message, state: FSMContext):
         reply_markup=ReplyKeyboardRemove()
     )
 
-    # Fixed: Cancel old tasks before starting new ones
-    start_prayer_scheduler(message.bot, user_id)
-    start_pre_prayer_scheduler(message.bot, user_id)
+    # Replans the user's events, dropping the ones planned for the old location
+    start_user_scheduler(user_id)
     
     await state.clear()
 
@@ -423,16 +507,22 @@ async def handle_text(message: Message, state: FSMContext):
         user_id = message.from_user.id
         
         city = message.text.strip()
-        cors = get_cor_city(city.capitalize())
+        try:
+            cors = await get_cor_city(city.capitalize())
+        except Exception as e:
+            logging.error(f"City lookup failed for {city!r}: {e}")
+            await message.answer("Couldn't look up the city right now. Please try again in a moment 😊")
+            return
         if cors is None:
             await message.answer("Oops — city not found. Try again 😊")
             return
 
-        prayer_times = get_by_cor(float(cors[0]), float(cors[1]))
+        prayer_times = await get_by_cor(float(cors[0]), float(cors[1]))
 
-        if not is_user_exist(user_id) and user_name:
-            insert_user(id=user_id, name=user_name, lat=float(cors[0]), lon=float(cors[1]))
-            insert_prayer_times(
+        if not await run_db(is_user_exist, user_id) and user_name:
+            await run_db(insert_user, id=user_id, name=user_name, lat=float(cors[0]), lon=float(cors[1]))
+            await run_db(
+                insert_prayer_times,
                 user_id,
                 prayer_times["Fajr"],
                 prayer_times["Sunrise"],
@@ -442,8 +532,9 @@ async def handle_text(message: Message, state: FSMContext):
                 prayer_times["Isha"],
             )
         else:
-            update_user(id=user_id, name=user_name, lat=float(cors[0]), lon=float(cors[1]))
-            update_prayer_times(
+            await run_db(update_user, id=user_id, name=user_name, lat=float(cors[0]), lon=float(cors[1]))
+            await run_db(
+                update_prayer_times,
                 user_id,
                 prayer_times["Fajr"],
                 prayer_times["Sunrise"],
@@ -464,9 +555,8 @@ async def handle_text(message: Message, state: FSMContext):
             reply_markup=ReplyKeyboardRemove()
         )
 
-        # Fixed: Cancel old tasks before starting new ones
-        start_prayer_scheduler(message.bot, user_id)
-        start_pre_prayer_scheduler(message.bot, user_id)
+        # Replans the user's events, dropping the ones planned for the old location
+        start_user_scheduler(user_id)
         
         await state.clear()
         return
@@ -476,24 +566,17 @@ async def handle_text(message: Message, state: FSMContext):
 # CALLBACK HANDLERS
 # ======================
 
-@dp.callback_query(F.data == "prayed_yes")
-async def handle_prayed_yes(query: CallbackQuery):
+@dp.callback_query(PrayedCallback.filter(F.answer == "yes"))
+async def handle_prayed_yes(query: CallbackQuery, callback_data: PrayedCallback):
+    # Stop the button's loading spinner before any database work
+    await query.answer()
     user_id = query.from_user.id
+    prayer_name = callback_data.prayer
+    day = date.fromisoformat(callback_data.day)
     
-    # Fixed: Get prayer name from stored data
-    prayer_data = last_warned_prayer.get(user_id)
-    
-    if prayer_data and isinstance(prayer_data, dict):
-        prayer_name = prayer_data.get('prayer', 'unknown')
-    else:
-        prayer_name = 'unknown'
-    
-    if prayer_name != "unknown":
-        add_prayer(prayer_name, user_id)
-    
-    # Clean up
-    if user_id in last_warned_prayer:
-        del last_warned_prayer[user_id]
+    # Only the first answer counts; a timed-out reminder was already marked as qaza
+    if pop_pending_reminder(user_id, prayer_name, day) is not None:
+        await run_db(add_prayer, prayer_name, user_id, day=day)
     
     # DELETE THE ORIGINAL WARNING MESSAGE IMMEDIATELY
     try:
@@ -501,34 +584,26 @@ async def handle_prayed_yes(query: CallbackQuery):
     except Exception as e:
         logging.error(f"Failed to delete warning message: {e}")
     
-    sent_message = await query.bot.send_animation(
-        chat_id=user_id,       
-        animation=get_gif(type='yes')       
+    sent_message = await media.send_animation(
+        await run_db(get_gif, 'yes'),
+        lambda animation: query.bot.send_animation(chat_id=user_id, animation=animation),
     )
-    await query.answer() 
     
     asyncio.create_task(
         delete_message_after(query.bot, user_id, sent_message.message_id, 10)
     )           
 
-@dp.callback_query(F.data == "prayed_no")
-async def handle_prayed_no(query: CallbackQuery):
+@dp.callback_query(PrayedCallback.filter(F.answer == "no"))
+async def handle_prayed_no(query: CallbackQuery, callback_data: PrayedCallback):
+    # Stop the button's loading spinner before any database work
+    await query.answer()
     user_id = query.from_user.id
+    prayer_name = callback_data.prayer
+    day = date.fromisoformat(callback_data.day)
     
-    # Fixed: Get prayer name from stored data
-    prayer_data = last_warned_prayer.get(user_id)
-    
-    if prayer_data and isinstance(prayer_data, dict):
-        prayer_name = prayer_data.get('prayer', 'unknown')
-    else:
-        prayer_name = 'unknown'
-    
-    if prayer_name != "unknown":
-        add_qaza(prayer_name, user_id)
-    
-    # Clean up
-    if user_id in last_warned_prayer:
-        del last_warned_prayer[user_id]
+    # Only the first answer counts; a timed-out reminder was already marked as qaza
+    if pop_pending_reminder(user_id, prayer_name, day) is not None:
+        await run_db(add_qaza, prayer_name, user_id, day=day)
     
     # DELETE THE ORIGINAL WARNING MESSAGE IMMEDIATELY
     try:
@@ -536,35 +611,107 @@ async def handle_prayed_no(query: CallbackQuery):
     except Exception as e:
         logging.error(f"Failed to delete warning message: {e}")
     
-    sent_message = await query.bot.send_animation(
-        chat_id=user_id,
-        animation=get_gif(type='no')
+    sent_message = await media.send_animation(
+        await run_db(get_gif, 'no'),
+        lambda animation: query.bot.send_animation(chat_id=user_id, animation=animation),
     )
-    await query.answer()
     
     asyncio.create_task(
         delete_message_after(query.bot, user_id, sent_message.message_id, 10)
     )
 
+# ======================
+# STATE RESTORE
+# ======================
+async def restore_state(bot: Bot):
+    """Reload dedupe keys, pending reminders and their auto-qaza timers after a restart"""
+    state = await run_db(state_store.load)
+
+    for user_id, kind, name, day in state["sent"]:
+        if not owns_user(user_id):
+            continue
+        if kind == "prayer":
+            user_sent = sent_today.setdefault(user_id, {})
+            if user_sent.get(name) is None or user_sent[name] < day:
+                user_sent[name] = day
+        else:
+            sent_pre.setdefault(user_id, {})[(name, day)] = True
+
+    last_prayer_notification.update(
+        (user_id, message_id) for user_id, message_id in state["notification"].items() if owns_user(user_id)
+    )
+
+    now = time.time()
+    for user_id, prayer, day, message_id, deadline in state["reminder"]:
+        if not owns_user(user_id):
+            continue
+        pending_reminders.setdefault(user_id, {})[(prayer, day)] = message_id
+        asyncio.create_task(
+            auto_mark_qaza_and_delete(bot, user_id, prayer, day, message_id, max(0, deadline - now))
+        )
+
+    media.restore(state["media"])
+
+    logging.info(
+        f"Restored state: {len(state['sent'])} sent keys, {len(state['reminder'])} pending reminders, "
+        f"{len(state['media'])} GIF file_ids"
+    )
+
+
 # ======================
 # MAIN
 # ======================
-async def main():
-    bot = Bot(token=access_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+def create_bot() -> Bot:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    return Bot(token=access_token, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+
+async def set_menu_button(bot: Bot):
     await bot.set_chat_menu_button(
         menu_button=MenuButtonWebApp(
             text="🕌 Qaza Tracker",
             web_app=WebAppInfo(url="https://jsur.vercel.app")
         )
     )
+
+
+async def start_services(bot: Bot):
+    """Restore state and start the background tasks for this process's users.
+
+    Returns the state flusher task, to be passed to stop_services().
+    """
+    await restore_state(bot)
+    try:
+        await run_db(load_content)  # reminders then send without reading it
+    except Exception as e:
+        logging.error(f"Failed to preload content, loading on first use: {e}")
+    flusher = asyncio.create_task(state_store.run_flusher())
+
     asyncio.create_task(daily_prayer_times_updater())
+    if SHARD_INDEX == 0:
+        asyncio.create_task(qaza_counters_reconciler())  # covers all users, so only once
     
-    users = get_all_users()
-    for user in users:
-        start_prayer_scheduler(bot, user["id"])
-        start_pre_prayer_scheduler(bot, user["id"])
+    asyncio.create_task(outbox.run_outbox())
+    asyncio.create_task(run_scheduler(partial(handle_scheduled_event, bot)))
+    asyncio.create_task(load_schedules())
+    return flusher
+
+
+async def stop_services(flusher):
+    flusher.cancel()
+    await asyncio.gather(flusher, return_exceptions=True)
+    await close_session()
+
+
+async def main():
+    bot = create_bot()
+    await set_menu_button(bot)
+    flusher = await start_services(bot)
         
-    await dp.start_polling(bot, drop_pending_updates=True)
+    try:
+        await dp.start_polling(bot, drop_pending_updates=True)
+    finally:
+        await stop_services(flusher)
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
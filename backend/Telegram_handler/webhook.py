@@ -0,0 +1,127 @@
+"""Webhook ingress for the bot, mounted on the FastAPI app (backend/main.py).
+
+Set BOT_MODE=webhook (read by backend/main.py, which only then imports this
+module) and WEBHOOK_URL to the public base URL of the API. Telegram
+then POSTs updates to WEBHOOK_PATH. The request is answered as soon as the
+update is on the queue; UPDATE_WORKERS tasks feed the queue through the
+dispatcher, so a slow handler never holds Telegram's connection.
+
+The bot's scheduler runs in the same process, so serve the API with a single
+uvicorn worker in this mode, and set WEBHOOK_SECRET so restarts keep the same
+secret token.
+"""
+import asyncio
+import logging
+import os
+import secrets
+
+from aiogram import Bot
+from aiogram.types import Update
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+
+from backend.Telegram_handler import tg_bot
+
+
+# ======================
+# SETTINGS
+# ======================
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "32"))
+
+# ======================
+# GLOBALS
+# ======================
+router = APIRouter()
+_queue: asyncio.Queue = None
+_bot: Bot = None
+_workers = []
+_stats = {"received": 0, "rejected": 0, "handled": 0, "failed": 0}
+
+
+@router.post(WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: str = Header(None)):
+    if _queue is None:
+        raise HTTPException(status_code=503, detail="Bot is not running")
+    if not secrets.compare_digest(x_telegram_bot_api_secret_token or "", WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+    data = await request.json()
+    try:
+        _queue.put_nowait(data)
+    except asyncio.QueueFull:
+        # Telegram redelivers the update later, which is the backpressure we want
+        _stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Update queue is full")
+
+    _stats["received"] += 1
+    return Response(status_code=200)
+
+
+async def _worker():
+    while True:
+        data = await _queue.get()
+        try:
+            update = Update.model_validate(data, context={"bot": _bot})
+            await tg_bot.dp.feed_update(_bot, update)
+            _stats["handled"] += 1
+        except Exception as e:
+            _stats["failed"] += 1
+            logging.error(f"Failed to handle update {data.get('update_id')}: {e}")
+        finally:
+            _queue.task_done()
+
+
+def webhook_stats() -> dict:
+    return {**_stats, "queued": _queue.qsize() if _queue is not None else 0}
+
+
+async def start_pipeline(bot: Bot, workers: int = None):
+    """Start the update queue and its handler workers"""
+    global _queue, _bot
+    _bot = bot
+    _queue = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+    for _ in range(workers or UPDATE_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def stop_pipeline():
+    global _queue
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
+
+
+async def start_bot():
+    """Run the whole bot in this process with a webhook instead of polling.
+
+    Returns what stop_bot() needs.
+    """
+    if not WEBHOOK_URL:
+        raise RuntimeError("BOT_MODE=webhook needs WEBHOOK_URL")
+
+    bot = tg_bot.create_bot()
+    await tg_bot.set_menu_button(bot)
+    flusher = await tg_bot.start_services(bot)
+    await start_pipeline(bot)
+    await bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=100,
+        # Presses made during a restart are still answerable: start_services
+        # restored their pending reminders before the first update comes in
+        drop_pending_updates=False,
+    )
+    logging.info(f"Webhook set, {UPDATE_WORKERS} update workers")
+    return bot, flusher
+
+
+async def stop_bot(bot: Bot, flusher):
+    # The webhook stays registered, so updates wait at Telegram during a restart
+    await stop_pipeline()
+    await tg_bot.stop_services(flusher)
+    await bot.session.close()
@@ -1,61 +1,76 @@
-from fastapi import APIRouter, HTTPException
-from backend.Database.qaza_stats import get_total_qazas, get_prayers_stats,get_user_info,qazas_rating,get_weekly_activity, get_profile_quote, get_monthly_data
-from backend.Database.database import add_prayer, add_qaza, add_bulk_qazas, mark_qazas_prayed
-from fastapi import APIRouter, HTTPException
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from backend.Database.qaza_stats import get_total_qazas, get_prayers_stats,get_user_info,qazas_rating,get_weekly_activity, get_monthly_data
+from backend.Database.database import log_ada_batch, add_bulk_qazas, mark_qazas_prayed
+from backend.Database.async_db import run_db
+from backend.Database.response_cache import cached, user_etag
+from backend.Database.content_store import get_profile_quote
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 
 router = APIRouter()
 
-@router.get("/total/{userId}")
-def total_qazas(userId: int):
+def _opaque(tag: str) -> str:
+    # If-None-Match compares weakly, so W/"x" and "x" are the same tag
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    if etag is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or _opaque(etag) in [_opaque(tag) for tag in header.split(",")]
+
+
+def _validators(etag: str) -> dict:
+    # no-cache: the WebApp may keep the response but must revalidate it
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def _user_response(request: Request, endpoint: str, user_id: int, params: tuple, compute):
+    """A cached per-user read with an ETag; 304 without reading anything when
+    the client's copy is still current"""
+    etag = user_etag(user_id, endpoint, *params)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=_validators(etag))
     try:
-        total = get_total_qazas(userId)
-        return {"total_qazas": total}
+        data = cached(endpoint, user_id, params, compute)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(data, headers=_validators(etag))
+
+
+@router.get("/total/{userId}")
+def total_qazas(userId: int, request: Request):
+    return _user_response(request, "total", userId, (), lambda: {"total_qazas": get_total_qazas(userId)})
     
 
 @router.get('/breakdown/{userId}')
-def get_qazas_stats(userId:int):
-    try:
-        stats=qazas_rating(userId)
-        return stats
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+def get_qazas_stats(userId: int, request: Request):
+    return _user_response(request, "breakdown", userId, (), lambda: qazas_rating(userId))
     
 
 @router.get("/stats/{userId}")
-def get_stats(userId: int):
-    try:
-        stats=get_prayers_stats (userId)
-        return stats
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    
-
-    
+def get_stats(userId: int, request: Request):
+    return _user_response(request, "stats", userId, (), lambda: get_prayers_stats(userId))
     
 
 @router.get('/user_info/{userId}')
-def get_user(userId: int):
-    try:
-        info=get_user_info(userId)
-        return info
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
+def get_user(userId: int, request: Request):
+    return _user_response(request, "user_info", userId, (), lambda: get_user_info(userId))
 
     
-    
 @router.get("/activity/weekly/{userId}")
-def get_weekly_stats(userId: int):
-    try:
-        weekly=get_weekly_activity(userId)
-        return weekly
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+def get_weekly_stats(userId: int, request: Request):
+    return _user_response(request, "weekly", userId, (), lambda: get_weekly_activity(userId))
     
     
 @router.get("/quotes")
@@ -67,12 +82,44 @@ def get_quotes():
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.get("/calendar/{userId}")
-def get_calendar_page(userId: int, year: int, month: int):
+def get_calendar_page(userId: int, year: int, month: int, request: Request):
+    return _user_response(request, "calendar", userId, (year, month), lambda: get_monthly_data(userId, year, month))
+
+
+@router.get("/dashboard/{userId}")
+async def get_dashboard(userId: int, request: Request):
+    """Everything the home and stats pages show, in one request.
+
+    The reads run concurrently on the database pool and share the per-endpoint
+    cache entries. The total is the sum of the breakdown, so it costs no query.
+    """
+    etag = user_etag(userId, "dashboard")
+    if _not_modified(request, etag):
+        # The quote is random anyway, the client keeps the one it has
+        return Response(status_code=304, headers=_validators(etag))
+
     try:
-        monthly = get_monthly_data(userId, year, month)
-        return monthly
+        # The quote normally comes from memory, but the first use loads the store
+        breakdown, stats, weekly, info, quote = await asyncio.gather(
+            run_db(cached, "breakdown", userId, (), lambda: qazas_rating(userId)),
+            run_db(cached, "stats", userId, (), lambda: get_prayers_stats(userId)),
+            run_db(cached, "weekly", userId, (), lambda: get_weekly_activity(userId)),
+            run_db(cached, "user_info", userId, (), lambda: get_user_info(userId)),
+            run_db(get_profile_quote),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    dashboard = {
+        "total_qazas": sum(breakdown.values()),
+        "breakdown": breakdown,
+        "stats": stats,
+        "weekly": weekly,
+        "user_info": info,
+        "quote": quote,
+    }
+    return JSONResponse(dashboard, headers=_validators(etag))
+
     
 # Request models
 class PrayerLog(BaseModel):
@@ -100,12 +147,12 @@ class AdaLogResponse(BaseModel):
 @router.post('/log/ada', response_model=AdaLogResponse)
 async def log_ada_prayers(request: AdaLogRequest):
     try:
-        # Process each prayer
-        for prayer_data in request.prayers:
-            if prayer_data.status == 'completed':
-                add_prayer(prayer_data.prayer, request.user_id)
-            elif prayer_data.status == 'missed':
-                add_qaza(prayer_data.prayer, request.user_id, prayer_data.reason)
+        # All prayers in one round-trip and one transaction
+        await run_db(
+            log_ada_batch,
+            request.user_id,
+            [prayer_data.dict() for prayer_data in request.prayers]
+        )
         
         return AdaLogResponse(
             success=True,
@@ -125,6 +172,7 @@ class BulkQazaRequest(BaseModel):
     asr: int = Field(default=0, ge=0, description="Number of Asr qazas to add")
     maghrib: int = Field(default=0, ge=0, description="Number of Maghrib qazas to add")
     isha: int = Field(default=0, ge=0, description="Number of Isha qazas to add")
+    batch_id: Optional[str] = Field(default=None, max_length=64, description="Client-chosen id, retries with the same id are not added twice")
 
 
 class BulkQazaResponse(BaseModel):
@@ -136,13 +184,18 @@ class BulkQazaResponse(BaseModel):
 async def log_bulk_qazas(request: BulkQazaRequest):
     try:
         # Add bulk qazas to database
-        add_bulk_qazas(
+        await run_db(
+            add_bulk_qazas,
             user_id=request.user_id,
             fajr=request.fajr,
             dhuhr=request.dhuhr,
             asr=request.asr,
             maghrib=request.maghrib,
-            isha=request.isha
+            isha=request.isha,
+            batch_id=request.batch_id,
+            progress=lambda prayer, inserted, total: logging.info(
+                f"Bulk add for {request.user_id}: {prayer} {inserted}/{total}"
+            )
         )
         
         return BulkQazaResponse(
@@ -171,13 +224,15 @@ class ClearQazaRequest(BaseModel):
 class ClearQazaResponse(BaseModel):
     success: bool
     message: str
+    remaining: Optional[Dict[str, int]] = None
 
 
 @router.post('/mark_prayed', response_model=ClearQazaResponse)
 async def mark_qazas_as_prayed(request: ClearQazaRequest):
     try:
         # Mark qazas as prayed
-        mark_qazas_prayed(
+        remaining = await run_db(
+            mark_qazas_prayed,
             user_id=request.user_id,
             fajr=request.fajr,
             dhuhr=request.dhuhr,
@@ -188,7 +243,8 @@ async def mark_qazas_as_prayed(request: ClearQazaRequest):
         
         return ClearQazaResponse(
             success=True,
-            message='Qaza prayers marked as prayed'
+            message='Qaza prayers marked as prayed',
+            remaining=remaining
         )
         
     except Exception as e:
@@ -1,10 +1,53 @@
 # backend/main.py
 
+import logging
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from backend.api.qaza import router as qaza_router
+from backend.Database.async_db import run_db
+from backend.Database.content_store import load_content
+
+try:
+    # Optional: brotli for clients that accept it, gzip for the rest
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = 1000
+
+# "webhook" runs the Telegram bot inside the API process. Only then is the bot
+# imported at all, so polling deployments and the Vercel entry point
+# (api/index.py) load just the API.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
 
-app = FastAPI(title="Qaza Tracker API")
+if BOT_MODE == "webhook":
+    from backend.Telegram_handler import webhook
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if BOT_MODE != "webhook":
+        # In webhook mode the bot's start_services() preloads it
+        try:
+            await run_db(load_content)
+        except Exception as e:
+            logging.error(f"Failed to preload content, loading on first use: {e}")
+        yield
+        return
+    bot, flusher = await webhook.start_bot()
+    try:
+        yield
+    finally:
+        await webhook.stop_bot(bot, flusher)
+
+
+app = FastAPI(title="Qaza Tracker API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,7 +59,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=COMPRESS_MIN_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE)
+
 app.include_router(qaza_router, prefix="/qaza", tags=["Qaza"])
+if BOT_MODE == "webhook":
+    app.include_router(webhook.router)
 
 @app.get("/")
 def root():
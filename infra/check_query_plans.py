@@ -0,0 +1,180 @@
+"""Query plan check for the per-user queries of backend/Database.
+
+Applies infra/migrations to a throwaway schema of a local Postgres, fills it
+with synthetic data, runs every query of database.py / qaza_stats.py with
+auto_explain, so the RPCs' own statements are checked too, and fails if one
+of them scans a whole table instead of using an index.
+
+    DATABASE_URL=postgresql://postgres@localhost/postgres python infra/check_query_plans.py
+
+Only psql is needed (PSQL=/path/to/psql to use another binary), and the
+server needs the auto_explain module (contrib) and a superuser to LOAD it.
+Never point it at the production database: it creates and drops the schema
+plan_check.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+
+MIGRATIONS = Path(__file__).parent / "migrations"
+SCHEMA = "plan_check"
+PSQL = os.getenv("PSQL", "psql")
+
+USERS = 2000
+QAZAS_PER_USER = 150
+ADA_DAYS = 60
+
+# Tables that must never be scanned sequentially
+CHECKED_TABLES = {"users", "prayer_times", "qazas", "daily_prayers", "qaza_counters", "qaza_ledger"}
+INDEX_SCANS = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+SEED = f"""
+insert into users (id, name, lat, lon)
+select g, 'user ' || g, 41.3, 69.2 from generate_series(1, {USERS}) g;
+
+insert into prayer_times (user_id, fajr, sunrise, dhuhr, asr, maghrib, isha, timezone)
+select id, '05:00', '06:30', '12:30', '16:30', '18:30', '20:00', 'Asia/Tashkent' from users;
+
+insert into qazas (user_id, prayer, reason, source, is_qaza, time_created, time_prayed)
+select u, (array['fajr', 'dhuhr', 'asr', 'maghrib', 'isha'])[1 + g % 5],
+       null, case when g % 10 = 0 then 'ada_page' else 'bulk_add' end,
+       g % 3 <> 0, now() - g * interval '1 hour',
+       case when g % 3 = 0 then now() - g * interval '30 minutes' end
+from generate_series(1, {USERS}) u, generate_series(1, {QAZAS_PER_USER}) g;
+
+insert into daily_prayers (user_id, prayer, prayer_date)
+select u, p, current_date - d
+from generate_series(1, {USERS}) u,
+     generate_series(0, {ADA_DAYS - 1}) d,
+     unnest(array['fajr', 'dhuhr', 'asr', 'maghrib', 'isha']) p;
+
+insert into qaza_ledger (user_id, prayer, kind, amount, source)
+select u, 'fajr', 'debt', 100, 'bulk_add' from generate_series(1, {USERS}) u;
+
+select reconcile_qaza_counters(null);
+analyze;
+"""
+
+# name -> statement, run as the backend runs it, inside a rolled-back
+# transaction. Table reads and writes are the SQL PostgREST generates for the
+# supabase-py calls; RPCs are called for real, so the plans checked are the
+# ones of the statements inside the function bodies (and their triggers).
+QUERIES = {
+    # database.py
+    "get_lat_lon / is_user_exist": "select lat, lon from users where id = 42",
+    "update_prayer_times": "update prayer_times set fajr = '05:01' where user_id = 42",
+    "update_qaza": (
+        "select id from qazas where user_id = 42 and prayer = 'asr' "
+        "order by time_created desc limit 1"
+    ),
+    "add_bulk_qazas chunk": (
+        "insert into qazas (user_id, prayer, source, batch_id, batch_seq) "
+        "select 42, 'asr', 'bulk_add', 'plan-check', g from generate_series(0, 99) g "
+        "on conflict (batch_id, prayer, batch_seq) do nothing"
+    ),
+    "add_bulk_qazas ledger": (
+        "insert into qaza_ledger (user_id, prayer, kind, amount, source, batch_id) "
+        "values (42, 'asr', 'debt', 100, 'bulk_add', 'plan-check') "
+        "on conflict (batch_id, prayer) do nothing"
+    ),
+    "log_ada_prayers": (
+        "select log_ada_prayers(42, '[{\"prayer\": \"asr\", \"status\": \"missed\"}, "
+        "{\"prayer\": \"fajr\", \"status\": \"completed\"}]', current_date)"
+    ),
+    # fajr needs more than the ledger holds, so both ledger and rows are cleared
+    "clear_oldest_qazas": "select clear_oldest_qazas(42, '{\"fajr\": 120, \"asr\": 10}')",
+    "reconcile_qaza_counters": "select * from reconcile_qaza_counters(42)",
+    "compact_bulk_qazas": "select compact_bulk_qazas(42)",
+    # qaza_stats.py
+    "get_user": "select id, name, lat, lon, joined, daily_goal from users where id = 42",
+    "get_prayer_times": "select * from prayer_times where user_id = 42",
+    "get_total_qazas / qazas_rating": "select prayer, outstanding from qaza_counters where user_id = 42",
+    "weekly chart": (
+        "select prayer_date from daily_prayers where user_id = 42 "
+        "and prayer_date >= current_date - 6 and prayer_date <= current_date"
+    ),
+    "get_prayer_stats": "select get_prayer_stats(42, current_date)",
+    "get_monthly_prayer_data": (
+        "select get_monthly_prayer_data(42, extract(year from current_date)::int, "
+        "extract(month from current_date)::int)"
+    ),
+    "get_ledger_cleared": (
+        "select id, amount from qaza_ledger where user_id = 42 and kind = 'cleared' "
+        "and created >= date_trunc('month', current_date) "
+        "and created < date_trunc('month', current_date) + interval '1 month' "
+        "order by id limit 1000"
+    ),
+    "qaza_counts": "select * from qaza_counts where user_id = 42",
+}
+
+# auto_explain logs the plan of every statement, including the ones run
+# inside functions and triggers, as a NOTICE that psql prints on stderr
+AUTO_EXPLAIN = """
+load 'auto_explain';
+set auto_explain.log_min_duration = 0;
+set auto_explain.log_nested_statements = on;
+set auto_explain.log_format = json;
+set auto_explain.log_level = notice;
+set client_min_messages = notice;
+"""
+PLAN_NOTICE = re.compile(r"NOTICE:\s+duration: [\d.]+ ms\s+plan:\n")
+
+
+def psql(sql=None, file=None, quiet=True):
+    cmd = [PSQL, os.environ["DATABASE_URL"], "-X", "-v", "ON_ERROR_STOP=1", "-At"]
+    if quiet:
+        cmd.append("-q")
+    cmd += ["-f", str(file) if file else "-"]
+    env = {**os.environ, "PGOPTIONS": f"-c search_path={SCHEMA} -c client_min_messages=warning"}
+    return subprocess.run(cmd, input=sql, env=env, check=True, capture_output=True, text=True)
+
+
+def scans(plan):
+    """Yield (node type, table, index) for every node of an EXPLAIN (FORMAT JSON) plan"""
+    yield plan["Node Type"], plan.get("Relation Name"), plan.get("Index Name")
+    for child in plan.get("Plans", []):
+        yield from scans(child)
+
+
+def logged_plans(sql):
+    """Run sql with auto_explain and return the plans of all statements it executed"""
+    stderr = psql(f"{AUTO_EXPLAIN}\nbegin;\n{sql};\nrollback;\n").stderr
+    decoder = json.JSONDecoder()
+    return [decoder.raw_decode(chunk.lstrip())[0]["Plan"] for chunk in PLAN_NOTICE.split(stderr)[1:]]
+
+
+def check(name, sql):
+    nodes = [node for plan in logged_plans(sql) for node in scans(plan)]
+    seq = sorted({rel for node, rel, _ in nodes if node == "Seq Scan" and rel in CHECKED_TABLES})
+    indexes = sorted({index for node, _, index in nodes if node in INDEX_SCANS})
+
+    ok = bool(indexes) and not seq
+    detail = ", ".join(f"Seq Scan on {rel}" for rel in seq) or ", ".join(indexes)
+    print(f"{'ok  ' if ok else 'FAIL'} {name}: {detail}")
+    return ok
+
+
+def main():
+    if "DATABASE_URL" not in os.environ:
+        sys.exit("DATABASE_URL is not set")
+
+    psql(f"drop schema if exists {SCHEMA} cascade; create schema {SCHEMA}")
+    try:
+        for migration in sorted(MIGRATIONS.glob("*.sql")):
+            psql(file=migration)
+        psql(SEED)
+        results = [check(name, sql) for name, sql in QUERIES.items()]
+    finally:
+        psql(f"drop schema if exists {SCHEMA} cascade")
+
+    failed = results.count(False)
+    print(f"{len(results) - failed}/{len(results)} queries use an index")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+-- Baseline: the schema the backend was written against, before any of the
+-- numbered migrations. Everything here is only created when it is missing:
+-- on the existing Supabase project the live tables, view and function are
+-- left alone, since the definitions below are a reconstruction of them.
+
+create table if not exists users (
+  id bigint primary key,  -- Telegram user id
+  name text,
+  lat double precision,
+  lon double precision,
+  joined timestamptz not null default now(),
+  daily_goal integer not null default 5
+);
+
+create table if not exists prayer_times (
+  user_id bigint primary key references users (id) on delete cascade,
+  fajr text,     -- local "HH:MM"
+  sunrise text,
+  dhuhr text,
+  asr text,
+  maghrib text,
+  isha text,
+  timezone text  -- IANA name, e.g. Asia/Tashkent
+);
+
+create table if not exists qazas (
+  id bigserial primary key,
+  user_id bigint not null references users (id) on delete cascade,
+  prayer text not null,  -- fajr, dhuhr, asr, maghrib, isha
+  reason text,
+  source text,           -- 'ada_page' (logged for today) or 'bulk_add'
+  is_qaza boolean not null default true,  -- false once made up
+  time_created timestamptz not null default now(),
+  time_prayed timestamptz
+);
+
+create table if not exists daily_prayers (
+  id bigserial primary key,
+  user_id bigint not null references users (id) on delete cascade,
+  prayer text not null,
+  prayer_date date not null default current_date
+);
+
+create table if not exists profile_quotes (
+  id bigserial primary key,
+  quote text not null
+);
+
+create table if not exists prayer_messages (
+  id bigserial primary key,
+  prayer text not null,
+  message text not null
+);
+
+create table if not exists gifs (
+  id bigserial primary key,
+  type text not null,  -- 'judging', 'yes', 'no'
+  url text not null
+);
+
+
+-- Outstanding qazas per user and prayer
+do $do$
+begin
+  if to_regclass('qaza_counts') is null then
+    create view qaza_counts as
+    select user_id, prayer, count(*) as counts
+    from qazas
+    where is_qaza
+    group by user_id, prayer;
+  end if;
+end;
+$do$;
+
+
+-- Calendar page (backend/Database/qaza_stats.py: get_monthly_data adds completionRate).
+-- days maps the day of month to the five prayers and whether each was prayed.
+do $do$
+begin
+  if to_regprocedure('get_monthly_prayer_data(bigint, integer, integer)') is null then
+    execute $fn$
+    create function get_monthly_prayer_data(p_user_id bigint, p_year integer, p_month integer)
+    returns json
+    language sql
+    stable
+    as $$
+      with bounds as (
+        select make_date(p_year, p_month, 1) as first_day,
+               (make_date(p_year, p_month, 1) + interval '1 month')::date as next_month
+      ),
+      ada as (
+        select d.prayer_date as day, d.prayer
+        from daily_prayers d, bounds b
+        where d.user_id = p_user_id
+          and d.prayer_date >= b.first_day
+          and d.prayer_date < b.next_month
+      ),
+      missed as (
+        select (q.time_created at time zone 'UTC')::date as day, q.prayer, q.reason
+        from qazas q, bounds b
+        where q.user_id = p_user_id
+          and q.source = 'ada_page'
+          and q.time_created >= b.first_day::timestamp
+          and q.time_created < b.next_month::timestamp
+      ),
+      made_up as (
+        select count(*) as amount
+        from qazas q, bounds b
+        where q.user_id = p_user_id
+          and not q.is_qaza
+          and q.time_prayed >= b.first_day::timestamp
+          and q.time_prayed < b.next_month::timestamp
+      ),
+      logged_days as (
+        select day from ada
+        union
+        select day from missed
+      )
+      select json_build_object(
+        'monthSummary', json_build_object(
+          'adaPrayers', (select count(*) from ada),
+          'missed', (select count(*) from missed),
+          'qazaDone', (select amount from made_up),
+          'mostMissedPrayer', (
+            select initcap(prayer) from missed
+            group by prayer order by count(*) desc, prayer limit 1
+          ),
+          'mostCommonReason', (
+            select reason from missed where reason is not null
+            group by reason order by count(*) desc, reason limit 1
+          )
+        ),
+        'days', coalesce((
+          select json_object_agg(
+            extract(day from l.day)::integer,
+            json_build_object('prayers', (
+              select json_agg(
+                json_build_object(
+                  'name', initcap(p.prayer),
+                  'prayed', exists (select 1 from ada a where a.day = l.day and a.prayer = p.prayer)
+                )
+                order by p.position
+              )
+              from unnest(array['fajr', 'dhuhr', 'asr', 'maghrib', 'isha']) with ordinality as p (prayer, position)
+            ))
+          )
+          from logged_days l
+        ), '{}'::json)
+      );
+    $$
+    $fn$;
+  end if;
+end;
+$do$;
@@ -0,0 +1,53 @@
+-- Stats page in one round-trip (backend/Database/qaza_stats.py: get_prayers_stats).
+--
+-- p_today is the API server's date.today(), so "today" means the same day it
+-- did when the stats were computed in Python. Timestamps are compared the way
+-- PostgREST compared the naive ISO strings we used to send (session timezone),
+-- and prayed days are UTC dates, like the time_prayed[:10] prefix we used.
+
+create or replace function get_prayer_stats(p_user_id bigint, p_today date default current_date)
+returns json
+language sql
+stable
+as $$
+  with prayed_days as (
+    select distinct (time_prayed at time zone 'UTC')::date as day
+    from qazas
+    where user_id = p_user_id
+      and is_qaza = false
+      and time_prayed is not null
+      and (time_prayed at time zone 'UTC')::date <= p_today
+  ),
+  -- Gaps and islands: consecutive days share the same day - row_number()
+  islands as (
+    select day, day - (row_number() over (order by day))::int as island
+    from prayed_days
+  )
+  select json_build_object(
+    'completed_today', (
+      select count(*)
+      from daily_prayers
+      where user_id = p_user_id and prayer_date = p_today
+    ),
+    'daily_goal', (
+      select daily_goal from users where id = p_user_id
+    ),
+    'cleared_this_week', (
+      select count(*)
+      from qazas
+      where user_id = p_user_id
+        and is_qaza = false
+        and time_prayed >= (p_today - 6)::timestamp
+        and time_prayed < (p_today + 1)::timestamp
+    ),
+    'total_prayers_logged', (
+      select count(*) from qazas where user_id = p_user_id
+    ),
+    -- Length of the island that ends today, 0 if nothing was prayed today
+    'current_streak', (
+      select count(*)
+      from islands
+      where island = (select island from islands where day = p_today)
+    )
+  );
+$$;
@@ -0,0 +1,225 @@
+-- Per-user, per-prayer qaza counters, so /qaza/total and /qaza/breakdown read
+-- at most five rows instead of counting the user's whole qazas history.
+--
+-- The counters are kept by statement-level triggers on qazas, inside the same
+-- transaction as the change, so every writer (add_qaza, add_bulk_qazas,
+-- mark_qazas_prayed, update_qaza, the SQL editor) keeps them right.
+-- reconcile_qaza_counters() verifies them against qazas and repairs drift.
+
+begin;
+
+create table if not exists qaza_counters (
+  user_id bigint not null references users (id) on delete cascade,
+  prayer text not null,
+  outstanding bigint not null default 0,  -- is_qaza = true
+  cleared bigint not null default 0,      -- is_qaza = false
+  logged bigint not null default 0,       -- all rows
+  primary key (user_id, prayer)
+);
+
+create or replace function qaza_counters_sync()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op = 'INSERT' then
+    insert into qaza_counters as c (user_id, prayer, outstanding, cleared, logged)
+    select user_id, prayer,
+           count(*) filter (where is_qaza),
+           count(*) filter (where not is_qaza),
+           count(*)
+    from new_rows
+    group by user_id, prayer
+    on conflict (user_id, prayer) do update set
+      outstanding = c.outstanding + excluded.outstanding,
+      cleared = c.cleared + excluded.cleared,
+      logged = c.logged + excluded.logged;
+
+  elsif tg_op = 'DELETE' then
+    insert into qaza_counters as c (user_id, prayer, outstanding, cleared, logged)
+    select user_id, prayer,
+           -count(*) filter (where is_qaza),
+           -count(*) filter (where not is_qaza),
+           -count(*)
+    from old_rows
+    group by user_id, prayer
+    on conflict (user_id, prayer) do update set
+      outstanding = c.outstanding + excluded.outstanding,
+      cleared = c.cleared + excluded.cleared,
+      logged = c.logged + excluded.logged;
+
+  else
+    insert into qaza_counters as c (user_id, prayer, outstanding, cleared, logged)
+    select user_id, prayer, sum(outstanding), sum(cleared), sum(logged)
+    from (
+      select user_id, prayer,
+             case when is_qaza then 1 else 0 end as outstanding,
+             case when is_qaza then 0 else 1 end as cleared,
+             1 as logged
+      from new_rows
+      union all
+      select user_id, prayer,
+             case when is_qaza then -1 else 0 end,
+             case when is_qaza then 0 else -1 end,
+             -1
+      from old_rows
+    ) changes
+    group by user_id, prayer
+    having sum(outstanding) <> 0 or sum(cleared) <> 0 or sum(logged) <> 0
+    on conflict (user_id, prayer) do update set
+      outstanding = c.outstanding + excluded.outstanding,
+      cleared = c.cleared + excluded.cleared,
+      logged = c.logged + excluded.logged;
+  end if;
+
+  return null;
+end;
+$$;
+
+-- No writes may slip in between the backfill and the triggers
+lock table qazas in share row exclusive mode;
+
+drop trigger if exists qaza_counters_insert on qazas;
+drop trigger if exists qaza_counters_update on qazas;
+drop trigger if exists qaza_counters_delete on qazas;
+
+create trigger qaza_counters_insert
+  after insert on qazas
+  referencing new table as new_rows
+  for each statement execute function qaza_counters_sync();
+
+create trigger qaza_counters_update
+  after update on qazas
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function qaza_counters_sync();
+
+create trigger qaza_counters_delete
+  after delete on qazas
+  referencing old table as old_rows
+  for each statement execute function qaza_counters_sync();
+
+delete from qaza_counters;
+insert into qaza_counters (user_id, prayer, outstanding, cleared, logged)
+select user_id, prayer,
+       count(*) filter (where is_qaza),
+       count(*) filter (where not is_qaza),
+       count(*)
+from qazas
+group by user_id, prayer;
+
+commit;
+
+
+-- Compares the counters with qazas (for one user, or everybody when p_user_id
+-- is null), fixes them and returns the rows that had drifted.
+create or replace function reconcile_qaza_counters(p_user_id bigint default null)
+returns table (
+  user_id bigint,
+  prayer text,
+  outstanding_drift bigint,
+  cleared_drift bigint,
+  logged_drift bigint
+)
+language plpgsql
+as $$
+begin
+  return query
+  with actual as (
+    select q.user_id, q.prayer,
+           count(*) filter (where q.is_qaza) as outstanding,
+           count(*) filter (where not q.is_qaza) as cleared,
+           count(*) as logged
+    from qazas q
+    where p_user_id is null or q.user_id = p_user_id
+    group by q.user_id, q.prayer
+  ),
+  current as (
+    select c.user_id, c.prayer, c.outstanding, c.cleared, c.logged
+    from qaza_counters c
+    where p_user_id is null or c.user_id = p_user_id
+  ),
+  drift as (
+    select coalesce(a.user_id, c.user_id) as user_id,
+           coalesce(a.prayer, c.prayer) as prayer,
+           coalesce(a.outstanding, 0) as outstanding,
+           coalesce(a.cleared, 0) as cleared,
+           coalesce(a.logged, 0) as logged,
+           coalesce(c.outstanding, 0) as old_outstanding,
+           coalesce(c.cleared, 0) as old_cleared,
+           coalesce(c.logged, 0) as old_logged
+    from actual a
+    full join current c on c.user_id = a.user_id and c.prayer = a.prayer
+    where coalesce(a.outstanding, 0) <> coalesce(c.outstanding, 0)
+       or coalesce(a.cleared, 0) <> coalesce(c.cleared, 0)
+       or coalesce(a.logged, 0) <> coalesce(c.logged, 0)
+  ),
+  -- Applies the difference rather than the counted values: a trigger
+  -- increment committed after this snapshot was taken is kept, not overwritten
+  repaired as (
+    insert into qaza_counters as c (user_id, prayer, outstanding, cleared, logged)
+    select d.user_id, d.prayer,
+           d.outstanding - d.old_outstanding,
+           d.cleared - d.old_cleared,
+           d.logged - d.old_logged
+    from drift d
+    on conflict on constraint qaza_counters_pkey do update set
+      outstanding = c.outstanding + excluded.outstanding,
+      cleared = c.cleared + excluded.cleared,
+      logged = c.logged + excluded.logged
+  )
+  select d.user_id, d.prayer,
+         d.old_outstanding - d.outstanding,
+         d.old_cleared - d.cleared,
+         d.old_logged - d.logged
+  from drift d;
+end;
+$$;
+
+
+-- Stats page: total_prayers_logged now comes from the counters as well
+create or replace function get_prayer_stats(p_user_id bigint, p_today date default current_date)
+returns json
+language sql
+stable
+as $$
+  with prayed_days as (
+    select distinct (time_prayed at time zone 'UTC')::date as day
+    from qazas
+    where user_id = p_user_id
+      and is_qaza = false
+      and time_prayed is not null
+      and (time_prayed at time zone 'UTC')::date <= p_today
+  ),
+  -- Gaps and islands: consecutive days share the same day - row_number()
+  islands as (
+    select day, day - (row_number() over (order by day))::int as island
+    from prayed_days
+  )
+  select json_build_object(
+    'completed_today', (
+      select count(*)
+      from daily_prayers
+      where user_id = p_user_id and prayer_date = p_today
+    ),
+    'daily_goal', (
+      select daily_goal from users where id = p_user_id
+    ),
+    'cleared_this_week', (
+      select count(*)
+      from qazas
+      where user_id = p_user_id
+        and is_qaza = false
+        and time_prayed >= (p_today - 6)::timestamp
+        and time_prayed < (p_today + 1)::timestamp
+    ),
+    'total_prayers_logged', (
+      select coalesce(sum(logged), 0) from qaza_counters where user_id = p_user_id
+    ),
+    -- Length of the island that ends today, 0 if nothing was prayed today
+    'current_streak', (
+      select count(*)
+      from islands
+      where island = (select island from islands where day = p_today)
+    )
+  );
+$$;
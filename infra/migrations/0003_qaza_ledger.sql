@@ -0,0 +1,307 @@
+-- Compact storage for bulk qaza debt.
+--
+-- Instead of one qazas row per missed prayer, bulk debt is a run-length
+-- ledger: a 'debt' entry of N prayers, and 'cleared' entries of N prayers as
+-- the user makes them up. Insert and clear cost the same for 10 or 10 000
+-- prayers. qaza_counters include the ledger, so totals and breakdowns read
+-- exactly as they do for row-per-qaza data.
+--
+-- Bulk debt is declared history, so it is the oldest debt a user has and is
+-- cleared before any qazas rows (see clear_ledger_qazas).
+
+create table if not exists qaza_ledger (
+  id bigserial primary key,
+  user_id bigint not null references users (id) on delete cascade,
+  prayer text not null,
+  kind text not null check (kind in ('debt', 'cleared')),
+  amount integer not null check (amount > 0),
+  source text,
+  created timestamptz not null default now()
+);
+
+create index if not exists qaza_ledger_user_prayer_idx on qaza_ledger (user_id, prayer, id);
+
+
+create or replace function qaza_ledger_counters_sync()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op = 'INSERT' then
+    insert into qaza_counters as c (user_id, prayer, outstanding, cleared, logged)
+    select user_id, prayer,
+           sum(case when kind = 'debt' then amount else -amount end),
+           sum(case when kind = 'cleared' then amount else 0 end),
+           sum(case when kind = 'debt' then amount else 0 end)
+    from new_rows
+    group by user_id, prayer
+    on conflict (user_id, prayer) do update set
+      outstanding = c.outstanding + excluded.outstanding,
+      cleared = c.cleared + excluded.cleared,
+      logged = c.logged + excluded.logged;
+  else
+    insert into qaza_counters as c (user_id, prayer, outstanding, cleared, logged)
+    select user_id, prayer,
+           -sum(case when kind = 'debt' then amount else -amount end),
+           -sum(case when kind = 'cleared' then amount else 0 end),
+           -sum(case when kind = 'debt' then amount else 0 end)
+    from old_rows
+    group by user_id, prayer
+    on conflict (user_id, prayer) do update set
+      outstanding = c.outstanding + excluded.outstanding,
+      cleared = c.cleared + excluded.cleared,
+      logged = c.logged + excluded.logged;
+  end if;
+
+  return null;
+end;
+$$;
+
+drop trigger if exists qaza_ledger_counters_insert on qaza_ledger;
+drop trigger if exists qaza_ledger_counters_delete on qaza_ledger;
+
+create trigger qaza_ledger_counters_insert
+  after insert on qaza_ledger
+  referencing new table as new_rows
+  for each statement execute function qaza_ledger_counters_sync();
+
+create trigger qaza_ledger_counters_delete
+  after delete on qaza_ledger
+  referencing old table as old_rows
+  for each statement execute function qaza_ledger_counters_sync();
+
+
+-- Outstanding ledger debt of one user and prayer
+create or replace function qaza_ledger_balance(p_user_id bigint, p_prayer text)
+returns bigint
+language sql
+stable
+as $$
+  select coalesce(sum(case when kind = 'debt' then amount else -amount end), 0)
+  from qaza_ledger
+  where user_id = p_user_id and prayer = p_prayer;
+$$;
+
+
+-- Clears up to the requested number of prayers from the ledger, e.g.
+-- p_counts = {"fajr": 3, "asr": 1}, and returns the counts it could not cover.
+create or replace function clear_ledger_qazas(p_user_id bigint, p_counts jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+  v_prayer text;
+  v_count integer;
+  v_cleared integer;
+  v_left jsonb := '{}'::jsonb;
+begin
+  for v_prayer, v_count in
+    select key, value::integer from jsonb_each_text(p_counts)
+  loop
+    if v_count <= 0 then
+      v_left := v_left || jsonb_build_object(v_prayer, 0);
+      continue;
+    end if;
+
+    -- Serializes concurrent clears of the same user and prayer
+    perform 1 from qaza_counters
+    where user_id = p_user_id and prayer = v_prayer
+    for update;
+
+    v_cleared := least(v_count, qaza_ledger_balance(p_user_id, v_prayer));
+    if v_cleared > 0 then
+      insert into qaza_ledger (user_id, prayer, kind, amount, source)
+      values (p_user_id, v_prayer, 'cleared', v_cleared, 'mark_prayed');
+    end if;
+
+    v_left := v_left || jsonb_build_object(v_prayer, v_count - v_cleared);
+  end loop;
+
+  return v_left;
+end;
+$$;
+
+
+-- Migration tool: folds a user's bulk_add qazas rows into ledger entries.
+-- Outstanding rows become one debt entry per prayer; cleared rows become a
+-- debt and a cleared entry per prayer and day, so weekly stats and streaks
+-- keep their dates. Returns the number of rows folded.
+create or replace function compact_bulk_qazas(p_user_id bigint)
+returns bigint
+language plpgsql
+as $$
+declare
+  v_ids bigint[];
+begin
+  select array_agg(id) into v_ids
+  from (
+    select id from qazas
+    where user_id = p_user_id and source = 'bulk_add'
+    for update
+  ) locked;
+
+  if v_ids is null then
+    return 0;
+  end if;
+
+  create temp table compacted on commit drop as
+  select prayer,
+         is_qaza,
+         case when is_qaza then null else (time_prayed at time zone 'UTC')::date end as day,
+         count(*) as amount,
+         min(time_created) as created,
+         min(time_prayed) as prayed
+  from qazas
+  where id = any (v_ids)
+  group by 1, 2, 3;
+
+  insert into qaza_ledger (user_id, prayer, kind, amount, source, created)
+  select p_user_id, prayer, 'debt', amount, 'bulk_add', created
+  from compacted
+  order by created;
+
+  insert into qaza_ledger (user_id, prayer, kind, amount, source, created)
+  select p_user_id, prayer, 'cleared', amount, 'mark_prayed', coalesce(prayed, created)
+  from compacted
+  where not is_qaza
+  order by prayed;
+
+  delete from qazas where id = any (v_ids);
+
+  drop table compacted;
+  return cardinality(v_ids);
+end;
+$$;
+
+
+-- Reconciliation now counts the ledger as well
+create or replace function reconcile_qaza_counters(p_user_id bigint default null)
+returns table (
+  user_id bigint,
+  prayer text,
+  outstanding_drift bigint,
+  cleared_drift bigint,
+  logged_drift bigint
+)
+language plpgsql
+as $$
+begin
+  return query
+  with actual as (
+    select a.user_id, a.prayer,
+           sum(a.outstanding)::bigint as outstanding,
+           sum(a.cleared)::bigint as cleared,
+           sum(a.logged)::bigint as logged
+    from (
+      select q.user_id, q.prayer,
+             count(*) filter (where q.is_qaza) as outstanding,
+             count(*) filter (where not q.is_qaza) as cleared,
+             count(*) as logged
+      from qazas q
+      where p_user_id is null or q.user_id = p_user_id
+      group by q.user_id, q.prayer
+      union all
+      select l.user_id, l.prayer,
+             sum(case when l.kind = 'debt' then l.amount else -l.amount end),
+             sum(case when l.kind = 'cleared' then l.amount else 0 end),
+             sum(case when l.kind = 'debt' then l.amount else 0 end)
+      from qaza_ledger l
+      where p_user_id is null or l.user_id = p_user_id
+      group by l.user_id, l.prayer
+    ) a
+    group by a.user_id, a.prayer
+  ),
+  current as (
+    select c.user_id, c.prayer, c.outstanding, c.cleared, c.logged
+    from qaza_counters c
+    where p_user_id is null or c.user_id = p_user_id
+  ),
+  drift as (
+    select coalesce(a.user_id, c.user_id) as user_id,
+           coalesce(a.prayer, c.prayer) as prayer,
+           coalesce(a.outstanding, 0) as outstanding,
+           coalesce(a.cleared, 0) as cleared,
+           coalesce(a.logged, 0) as logged,
+           coalesce(c.outstanding, 0) as old_outstanding,
+           coalesce(c.cleared, 0) as old_cleared,
+           coalesce(c.logged, 0) as old_logged
+    from actual a
+    full join current c on c.user_id = a.user_id and c.prayer = a.prayer
+    where coalesce(a.outstanding, 0) <> coalesce(c.outstanding, 0)
+       or coalesce(a.cleared, 0) <> coalesce(c.cleared, 0)
+       or coalesce(a.logged, 0) <> coalesce(c.logged, 0)
+  ),
+  -- Applies the difference rather than the counted values: a trigger
+  -- increment committed after this snapshot was taken is kept, not overwritten
+  repaired as (
+    insert into qaza_counters as c (user_id, prayer, outstanding, cleared, logged)
+    select d.user_id, d.prayer,
+           d.outstanding - d.old_outstanding,
+           d.cleared - d.old_cleared,
+           d.logged - d.old_logged
+    from drift d
+    on conflict on constraint qaza_counters_pkey do update set
+      outstanding = c.outstanding + excluded.outstanding,
+      cleared = c.cleared + excluded.cleared,
+      logged = c.logged + excluded.logged
+  )
+  select d.user_id, d.prayer,
+         d.old_outstanding - d.outstanding,
+         d.old_cleared - d.cleared,
+         d.old_logged - d.logged
+  from drift d;
+end;
+$$;
+
+
+-- Stats page with ledger clears counted by the day they were made
+create or replace function get_prayer_stats(p_user_id bigint, p_today date default current_date)
+returns json
+language sql
+stable
+as $$
+  with cleared as (
+    select time_prayed as at, 1 as amount
+    from qazas
+    where user_id = p_user_id and is_qaza = false and time_prayed is not null
+    union all
+    select created, amount
+    from qaza_ledger
+    where user_id = p_user_id and kind = 'cleared'
+  ),
+  prayed_days as (
+    select distinct (at at time zone 'UTC')::date as day
+    from cleared
+    where (at at time zone 'UTC')::date <= p_today
+  ),
+  -- Gaps and islands: consecutive days share the same day - row_number()
+  islands as (
+    select day, day - (row_number() over (order by day))::int as island
+    from prayed_days
+  )
+  select json_build_object(
+    'completed_today', (
+      select count(*)
+      from daily_prayers
+      where user_id = p_user_id and prayer_date = p_today
+    ),
+    'daily_goal', (
+      select daily_goal from users where id = p_user_id
+    ),
+    'cleared_this_week', (
+      select coalesce(sum(amount), 0)
+      from cleared
+      where at >= (p_today - 6)::timestamp
+        and at < (p_today + 1)::timestamp
+    ),
+    'total_prayers_logged', (
+      select coalesce(sum(logged), 0) from qaza_counters where user_id = p_user_id
+    ),
+    -- Length of the island that ends today, 0 if nothing was prayed today
+    'current_streak', (
+      select count(*)
+      from islands
+      where island = (select island from islands where day = p_today)
+    )
+  );
+$$;
@@ -0,0 +1,50 @@
+-- Logs a whole /qaza/log/ada batch in one call and one transaction.
+--
+-- p_prayers is [{"prayer": "fajr", "status": "completed" | "missed", "reason": ...}].
+-- For every entry it does what add_prayer/add_qaza did in three requests:
+-- forget today's earlier answer for that prayer (the daily_prayers row and
+-- the ada_page qaza, never bulk qazas), then record the new one. Entries are
+-- applied in order, so a repeated prayer ends with its last status.
+-- p_today is the day the answer is for: the API server's date.today(), or the
+-- user's local date of the prayer when the bot logs a reminder answer. The
+-- qaza is stamped with the current UTC time of day on p_today, so the delete
+-- window below and the calendar (UTC date of time_created) see it on that day.
+
+create or replace function log_ada_prayers(p_user_id bigint, p_prayers jsonb, p_today date default current_date)
+returns void
+language plpgsql
+as $$
+declare
+  v_item record;
+begin
+  for v_item in
+    select prayer, status, reason
+    from jsonb_to_recordset(p_prayers) as x(prayer text, status text, reason text)
+  loop
+    delete from daily_prayers
+    where user_id = p_user_id
+      and prayer = v_item.prayer
+      and prayer_date = p_today;
+
+    delete from qazas
+    where user_id = p_user_id
+      and prayer = v_item.prayer
+      and source = 'ada_page'
+      and time_created >= p_today::timestamp at time zone 'UTC'
+      and time_created < (p_today + 1)::timestamp at time zone 'UTC';
+
+    if v_item.status = 'completed' then
+      insert into daily_prayers (user_id, prayer, prayer_date)
+      values (p_user_id, v_item.prayer, p_today);
+    elsif v_item.status = 'missed' then
+      insert into qazas (user_id, prayer, reason, source, time_created)
+      values (
+        p_user_id, v_item.prayer, v_item.reason, 'ada_page',
+        (p_today + (now() at time zone 'UTC')::time) at time zone 'UTC'
+      );
+    else
+      raise exception 'unknown status %', v_item.status;
+    end if;
+  end loop;
+end;
+$$;
@@ -0,0 +1,50 @@
+-- Clears the oldest N outstanding qazas of every prayer in one call
+-- (backend/Database/database.py: mark_qazas_prayed).
+--
+-- p_counts is {"fajr": 3, "asr": 10, ...}. Ledger debt is cleared first
+-- (clear_ledger_qazas), the rest picks the oldest rows of all prayers in one
+-- statement. SKIP LOCKED lets two concurrent clears of the same user take
+-- different rows instead of waiting on or double-clearing each other.
+-- Returns the outstanding count of each prayer afterwards.
+
+create or replace function clear_oldest_qazas(p_user_id bigint, p_counts jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+  v_left jsonb;
+begin
+  v_left := clear_ledger_qazas(p_user_id, p_counts);
+
+  with wanted as (
+    select key as prayer, value::integer as amount
+    from jsonb_each_text(v_left)
+    where value::integer > 0
+  ),
+  oldest as (
+    select q.id
+    from wanted w
+    cross join lateral (
+      select id
+      from qazas
+      where user_id = p_user_id
+        and prayer = w.prayer
+        and is_qaza
+      order by id
+      limit w.amount
+      for update skip locked
+    ) q
+  )
+  update qazas
+  set is_qaza = false,
+      time_prayed = now()
+  from oldest
+  where qazas.id = oldest.id;
+
+  return (
+    select jsonb_object_agg(p.prayer, coalesce(c.outstanding, 0))
+    from unnest(array['fajr', 'dhuhr', 'asr', 'maghrib', 'isha']) as p (prayer)
+    left join qaza_counters c on c.user_id = p_user_id and c.prayer = p.prayer
+  );
+end;
+$$;
@@ -0,0 +1,15 @@
+-- Idempotent bulk adds (backend/Database/database.py: add_bulk_qazas).
+--
+-- Every row of a bulk add carries the client's batch id and its position in
+-- the batch. Chunks are inserted with ON CONFLICT DO NOTHING on these
+-- columns, so a retried request or chunk never inserts the same qaza twice.
+-- Rows without a batch id (NULL) never conflict.
+
+alter table qazas add column if not exists batch_id text;
+alter table qazas add column if not exists batch_seq integer;
+
+create unique index if not exists qazas_batch_idx on qazas (batch_id, prayer, batch_seq);
+
+alter table qaza_ledger add column if not exists batch_id text;
+
+create unique index if not exists qaza_ledger_batch_idx on qaza_ledger (batch_id, prayer);
@@ -0,0 +1,27 @@
+-- Indexes for the hot per-user queries. infra/check_query_plans.py checks
+-- that every query of backend/Database uses one of them.
+--
+-- On a large production table prefer running each statement by hand with
+-- `create index concurrently` (not allowed inside the SQL editor's transaction).
+
+-- clear_oldest_qazas / qaza_counts: outstanding qazas of a prayer, oldest first
+create index if not exists qazas_outstanding_idx
+  on qazas (user_id, prayer, id)
+  where is_qaza;
+
+-- reconcile_qaza_counters and the qaza_counters backfill for one user
+create index if not exists qazas_user_state_idx
+  on qazas (user_id, is_qaza, prayer);
+
+-- log_ada_prayers replacing today's entry, update_qaza, compact_bulk_qazas
+create index if not exists qazas_user_prayer_source_idx
+  on qazas (user_id, prayer, source, time_created);
+
+-- get_prayer_stats / get_monthly_prayer_data: made-up qazas by date
+create index if not exists qazas_cleared_idx
+  on qazas (user_id, time_prayed)
+  where not is_qaza;
+
+-- log_ada_prayers, the weekly chart and the calendar
+create index if not exists daily_prayers_user_date_idx
+  on daily_prayers (user_id, prayer_date, prayer);
@@ -0,0 +1,26 @@
+"""Locations and dates the local prayer time engine is checked on"""
+from datetime import date
+from pathlib import Path
+
+
+GOLDEN_PATH = Path(__file__).parent / "data" / "aladhan_method2_school1.json"
+
+# (name, lat, lon, timezone, date)
+CASES = [
+    ("Tashkent", 41.2995, 69.2401, "Asia/Tashkent", date(2025, 3, 21)),
+    ("Tashkent", 41.2995, 69.2401, "Asia/Tashkent", date(2025, 6, 21)),
+    ("Tashkent", 41.2995, 69.2401, "Asia/Tashkent", date(2025, 12, 21)),
+    ("Seoul", 37.5665, 126.9780, "Asia/Seoul", date(2025, 3, 21)),
+    ("Seoul", 37.5665, 126.9780, "Asia/Seoul", date(2025, 9, 15)),
+    # The days before and after both US DST transitions of 2025
+    ("New York", 40.7128, -74.0060, "America/New_York", date(2025, 3, 8)),
+    ("New York", 40.7128, -74.0060, "America/New_York", date(2025, 3, 9)),
+    ("New York", 40.7128, -74.0060, "America/New_York", date(2025, 11, 1)),
+    ("New York", 40.7128, -74.0060, "America/New_York", date(2025, 11, 2)),
+    # Twilight never ends: Fajr and Isha come from the angle-based rule
+    ("Oslo", 59.9139, 10.7522, "Europe/Oslo", date(2025, 6, 21)),
+    ("Stockholm", 59.3293, 18.0686, "Europe/Stockholm", date(2025, 6, 1)),
+]
+
+# Compared to the minute with Aladhan
+COMPARED = ("Fajr", "Sunrise", "Dhuhr", "Asr", "Maghrib", "Isha")
@@ -0,0 +1,39 @@
+"""Records the Aladhan timings that tests/test_prayer_calc.py compares with.
+
+    python -m tests.record_aladhan
+
+Fetches every case of prayer_calc_cases.py from api.aladhan.com with the
+bot's settings (method=2, school=1) and writes them to GOLDEN_PATH. Run it
+again after adding a case, and commit the file. Once the golden tests pass,
+PRAYER_TIMES_SOURCE=local can serve users from the local engine.
+"""
+import asyncio
+import json
+
+from backend.Telegram_handler.http_client import close_session
+from backend.Telegram_handler.prayer_times import get_by_cor_aladhan
+from tests.prayer_calc_cases import CASES, GOLDEN_PATH
+
+
+async def main():
+    recorded = []
+    try:
+        for name, lat, lon, timezone, day in CASES:
+            timings = await get_by_cor_aladhan(lat, lon, day=day, timezone=timezone)
+            recorded.append({
+                "name": name, "lat": lat, "lon": lon, "timezone": timezone,
+                "date": day.isoformat(), "timings": timings,
+            })
+            print(f"{name} {day}: {timings}")
+    finally:
+        await close_session()
+
+    GOLDEN_PATH.parent.mkdir(exist_ok=True)
+    with open(GOLDEN_PATH, "w") as f:
+        json.dump(recorded, f, indent=2)
+        f.write("\n")
+    print(f"Wrote {len(recorded)} cases to {GOLDEN_PATH}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""The local prayer time engine (backend/Telegram_handler/prayer_calc.py).
+
+The golden test compares it to the minute with Aladhan responses recorded by
+tests/record_aladhan.py. The other tests need no recordings: the batch path,
+DST transitions, the high-latitude rule and places where the sun never rises
+or sets. Users get Aladhan's times (PRAYER_TIMES_SOURCE) until the golden test
+passes on committed recordings.
+"""
+import json
+import os
+from datetime import date
+
+import pytest
+
+from backend.Telegram_handler.prayer_calc import TIMINGS, calc_prayer_times, compute_times, format_minutes
+from tests.prayer_calc_cases import CASES, COMPARED, GOLDEN_PATH
+
+
+def minutes(hhmm: str) -> int:
+    return int(hhmm[:2]) * 60 + int(hhmm[3:5])
+
+
+def _recorded():
+    if not os.path.exists(GOLDEN_PATH):
+        return []
+    with open(GOLDEN_PATH) as f:
+        return json.load(f)
+
+
+RECORDED = _recorded()
+
+
+@pytest.mark.skipif(not RECORDED, reason=f"no recordings, run python -m tests.record_aladhan to create {GOLDEN_PATH}")
+@pytest.mark.parametrize("case", RECORDED, ids=lambda case: f"{case['name']}-{case['date']}")
+def test_matches_aladhan(case):
+    ours = calc_prayer_times(case["lat"], case["lon"], case["timezone"], date.fromisoformat(case["date"]))
+    # Aladhan may append the timezone, e.g. "05:12 (+05)"
+    expected = {name: case["timings"][name][:5] for name in COMPARED}
+    assert {name: ours[name] for name in COMPARED} == expected
+
+
+def test_recordings_cover_every_case():
+    if not RECORDED:
+        pytest.skip("no recordings")
+    recorded = {(case["name"], case["date"]) for case in RECORDED}
+    assert recorded == {(name, day.isoformat()) for name, _, _, _, day in CASES}
+
+
+def test_batch_matches_single():
+    lats = [case[1] for case in CASES]
+    lons = [case[2] for case in CASES]
+    timezones = [case[3] for case in CASES]
+    days = sorted({case[4] for case in CASES})
+    batch = compute_times(lats, lons, timezones, days)
+
+    for i, (_, lat, lon, timezone, day) in enumerate(CASES):
+        single = calc_prayer_times(lat, lon, timezone, day)
+        j = days.index(day)
+        assert {name: format_minutes(int(batch[name][i, j])) for name in TIMINGS} == single
+
+
+@pytest.mark.parametrize("before, after, shift", [
+    (date(2025, 3, 8), date(2025, 3, 9), 60),     # clocks go forward
+    (date(2025, 11, 1), date(2025, 11, 2), -60),  # clocks go back
+])
+def test_dst_transition(before, after, shift):
+    first = calc_prayer_times(40.7128, -74.0060, "America/New_York", before)
+    second = calc_prayer_times(40.7128, -74.0060, "America/New_York", after)
+    for name in COMPARED:
+        # The sun itself moves by at most a few minutes a day
+        assert abs(minutes(second[name]) - minutes(first[name]) - shift) <= 3, name
+
+
+def test_high_latitude_uses_angle_based_rule():
+    # Oslo at midsummer: the sun never gets 15 degrees below the horizon
+    times = calc_prayer_times(59.9139, 10.7522, "Europe/Oslo", date(2025, 6, 21))
+    night = (minutes(times["Sunrise"]) - minutes(times["Sunset"])) % 1440
+    portion = 15 / 60 * night
+    # Isha is after midnight here
+    assert abs((minutes(times["Isha"]) - minutes(times["Sunset"])) % 1440 - portion) <= 1
+    assert abs((minutes(times["Sunrise"]) - minutes(times["Fajr"])) % 1440 - portion) <= 1
+
+
+def test_midnight_sun_has_no_sunrise_or_sunset():
+    times = calc_prayer_times(69.6492, 18.9553, "Europe/Oslo", date(2025, 6, 21))
+    for name in ("Fajr", "Sunrise", "Sunset", "Maghrib", "Isha"):
+        assert times[name] is None, name
+    assert times["Dhuhr"] is not None
+
+
+def test_polar_night_has_no_sunrise_or_sunset():
+    times = calc_prayer_times(69.6492, 18.9553, "Europe/Oslo", date(2025, 12, 21))
+    for name in ("Sunrise", "Sunset", "Maghrib"):
+        assert times[name] is None, name
+    assert times["Dhuhr"] is not None
+    assert times["Fajr"] is not None and times["Isha"] is not None
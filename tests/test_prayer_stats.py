@@ -0,0 +1,146 @@
+"""get_prayer_stats (infra/migrations) against the Python it replaced.
+
+old_prayer_stats below is the removed qaza_stats.get_prayers_stats, with its
+five PostgREST queries turned into filters over the same fixture rows. The
+RPC has to return the same numbers for every fixture user, before and after
+their bulk rows are folded into the ledger.
+
+Needs a local Postgres, like infra/check_query_plans.py:
+
+    DATABASE_URL=postgresql://postgres@localhost/postgres python -m pytest tests
+"""
+import json
+import os
+import subprocess
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+
+MIGRATIONS = Path(__file__).parent.parent / "infra" / "migrations"
+SCHEMA = "stats_check"
+PSQL = os.getenv("PSQL", "psql")
+
+TODAY = date(2025, 3, 21)
+PRAYERS = ["fajr", "dhuhr", "asr", "maghrib", "isha"]
+
+pytestmark = pytest.mark.skipif("DATABASE_URL" not in os.environ, reason="needs DATABASE_URL")
+
+
+def at(days_ago: int, hour: int = 12, minute: int = 0, second: int = 0) -> datetime:
+    return datetime.combine(TODAY - timedelta(days=days_ago), time(hour, minute, second), tzinfo=timezone.utc)
+
+
+# user_id -> daily goal
+USERS = {1: 5, 2: 3, 3: 5, 4: 5, 5: 2}
+
+# (user_id, prayer, source, time_prayed or None while outstanding)
+QAZAS = [
+    # streak of 3 ending today, several clears a day, one old cleared day
+    *[(1, PRAYERS[i % 5], "bulk_add", at(d, 6 + i)) for d in (0, 1, 2) for i in range(3)],
+    (1, "asr", "bulk_add", at(10)),
+    *[(1, "isha", "bulk_add", None) for _ in range(4)],
+    (1, "fajr", "ada_page", None),
+    # week boundaries: first and last instant inside, one second outside
+    (2, "fajr", "bulk_add", at(6, 0, 0, 0)),
+    (2, "dhuhr", "bulk_add", at(0, 23, 59, 59)),
+    (2, "asr", "bulk_add", at(7, 23, 59, 59)),
+    (2, "maghrib", "ada_page", None),
+    # prayed yesterday but not today: no streak
+    (3, "fajr", "bulk_add", at(1)),
+    (3, "dhuhr", "bulk_add", at(2)),
+    # a gap two days ago breaks the streak at 2
+    (4, "fajr", "bulk_add", at(0, 0, 0, 1)),
+    (4, "fajr", "ada_page", at(1, 23, 59, 59)),
+    (4, "isha", "bulk_add", at(3)),
+    (4, "isha", "bulk_add", at(4)),
+    # user 5 has no qazas at all
+]
+
+# (user_id, prayer, prayer_date)
+DAILY = [
+    *[(1, p, TODAY) for p in PRAYERS],
+    *[(1, p, TODAY - timedelta(days=1)) for p in PRAYERS[:2]],
+    (2, "fajr", TODAY),
+    (3, "asr", TODAY - timedelta(days=1)),
+    (5, "isha", TODAY),
+]
+
+
+def old_prayer_stats(user_id: int, today: date) -> dict:
+    """The removed qaza_stats.get_prayers_stats, over the fixture rows"""
+    qazas = [row for row in QAZAS if row[0] == user_id]
+    cleared = [row[3] for row in qazas if row[3] is not None]
+
+    # .gte/.lte on the naive isoformat of today - 6 at 00:00 and today at 23:59:59.999999
+    start = datetime.combine(today - timedelta(days=6), time.min, tzinfo=timezone.utc)
+    end = datetime.combine(today, time.max, tzinfo=timezone.utc)
+
+    # row["time_prayed"][:10] of the UTC timestamps PostgREST returns
+    prayed_dates = {prayed.isoformat()[:10] for prayed in cleared}
+    streak = 0
+    current_day = today
+    while current_day.isoformat() in prayed_dates:
+        streak += 1
+        current_day -= timedelta(days=1)
+
+    return {
+        "completed_today": sum(1 for u, _, day in DAILY if u == user_id and day == today),
+        "daily_goal": USERS[user_id],
+        "cleared_this_week": sum(1 for prayed in cleared if start <= prayed <= end),
+        "total_prayers_logged": len(qazas),
+        "current_streak": streak,
+    }
+
+
+def psql(sql: str = None, file: Path = None) -> str:
+    cmd = [PSQL, os.environ["DATABASE_URL"], "-X", "-q", "-v", "ON_ERROR_STOP=1", "-At"]
+    cmd += ["-f", str(file)] if file else ["-c", sql]
+    env = {**os.environ, "PGOPTIONS": f"-c search_path={SCHEMA} -c timezone=UTC -c client_min_messages=warning"}
+    return subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+
+
+def literal(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (datetime, date, str)):
+        return f"'{value.isoformat() if not isinstance(value, str) else value}'"
+    return str(value)
+
+
+def values(rows) -> str:
+    return ", ".join("(" + ", ".join(map(literal, row)) + ")" for row in rows)
+
+
+@pytest.fixture(scope="module")
+def database():
+    psql(f"drop schema if exists {SCHEMA} cascade; create schema {SCHEMA}")
+    try:
+        for migration in sorted(MIGRATIONS.glob("*.sql")):
+            psql(file=migration)
+        psql(
+            f"insert into users (id, daily_goal) values {values(USERS.items())};"
+            f"insert into qazas (user_id, prayer, source, is_qaza, time_prayed, time_created) values "
+            + values((u, p, s, prayed is None, prayed, at(30)) for u, p, s, prayed in QAZAS) + ";"
+            f"insert into daily_prayers (user_id, prayer, prayer_date) values {values(DAILY)};"
+        )
+        yield
+    finally:
+        psql(f"drop schema if exists {SCHEMA} cascade")
+
+
+def rpc_stats(user_id: int) -> dict:
+    return json.loads(psql(f"select get_prayer_stats({user_id}, '{TODAY.isoformat()}')"))
+
+
+@pytest.mark.parametrize("user_id", USERS)
+def test_matches_old_python(database, user_id):
+    assert rpc_stats(user_id) == old_prayer_stats(user_id, TODAY)
+
+
+@pytest.mark.parametrize("user_id", USERS)
+def test_matches_old_python_after_ledger_compaction(database, user_id):
+    expected = old_prayer_stats(user_id, TODAY)
+    psql(f"select compact_bulk_qazas({user_id})")
+    assert rpc_stats(user_id) == expected